@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from magpie.settings import settings
+from utils.db import session_autocommit
+from models import BearerToken, Provider
+
+
+log = logging.getLogger('asynccrawler')
+
+
+class AsyncCrawlerEngine:
+    """
+    Crawl many bearertokens concurrently on a single asyncio event loop.
+
+    Crawling is mostly waiting for the network, so the pagination loops of all the bearertokens
+    (see `AbstractCrawler.run_async()`) are multiplexed on one loop and they share a single
+    `aiohttp.ClientSession`, whose connector limits the number of requests in flight.
+    Only the crawling stage runs here: downloading and indexing run as usual, f.i. with
+    `manage.py update`.
+
+    Parameters:
+    bearertoken_ids -- a list of `models.BearerToken.id`.
+    max_connections -- max number of requests in flight, default:
+        settings.ASYNC_CRAWLER_MAX_CONNECTIONS.
+    """
+    # Imports here to avoid circular imports.
+    from twitterlib.crawler import TwitterCrawler
+    from facebooklib.crawler import FacebookCrawler
+    from dropboxlib.crawler import DropboxCrawler
+
+    crawlers_class_names = {
+        Provider.NAME_TWITTER: TwitterCrawler,
+        Provider.NAME_FACEBOOK: FacebookCrawler,
+        Provider.NAME_DROPBOX: DropboxCrawler,
+    }
+
+    def __init__(self, bearertoken_ids, max_connections=None):
+        self.bearertoken_ids = bearertoken_ids
+        self.max_connections = max_connections or settings.ASYNC_CRAWLER_MAX_CONNECTIONS
+
+    def run(self):
+        """
+        Crawl all the bearertokens and return when they are all done.
+        Return a dictionary of the bearertoken ids whose crawling failed, mapped to the exception.
+        """
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(self._crawl_all())
+
+    async def _crawl_all(self):
+        crawlers = self._init_crawlers()
+        connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                         limit_per_host=settings.ASYNC_CRAWLER_MAX_PER_HOST)
+        async with aiohttp.ClientSession(connector=connector) as http:
+            results = await asyncio.gather(*[crawler.run_async(http) for crawler in
+                                             crawlers.values()], return_exceptions=True)
+
+        errors = {}
+        for bearertoken_id, result in zip(crawlers.keys(), results):
+            if isinstance(result, Exception):
+                log.error("Crawling failed for bearertoken_id: {}: {!r}".format(
+                    bearertoken_id, result))
+                errors[bearertoken_id] = result
+        return errors
+
+    def _init_crawlers(self):
+        """
+        Build a crawler for each bearertoken.
+        Return a dictionary of crawlers, by bearertoken id.
+        """
+        crawlers = {}
+        with session_autocommit() as sex:
+            bearertokens = sex.query(BearerToken).filter(
+                BearerToken.id.in_(self.bearertoken_ids)).all()
+            for bearertoken in bearertokens:
+                try:
+                    crawler_class = self.crawlers_class_names[bearertoken.provider.name]
+                except KeyError:
+                    log.warning("No crawler for bearertoken_id: {} ({}).".format(
+                        bearertoken.id, bearertoken.provider.name))
+                    continue
+                crawlers[bearertoken.id] = crawler_class(bearertoken)
+        return crawlers
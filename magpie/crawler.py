@@ -1,6 +1,37 @@
 from abc import ABCMeta, abstractmethod
+import asyncio
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+import json
+import logging
+import time
 
+from magpie.settings import settings
 from utils.db import session_autocommit
+from utils.exceptions import RateLimitError
+from utils.ratelimit import RateLimiter
+
+
+log = logging.getLogger('crawler')
+
+
+class FetchedResponse:
+    """
+    A response fetched asynchronously (see `AbstractCrawler.run_async()`), with the same
+    interface of a `requests.models.Response` used by `Api<Provider>Response` classes.
+
+    Parameters:
+    status_code -- the HTTP status code.
+    content -- the body of the response, bytes.
+    headers -- the HTTP headers of the response.
+    """
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content.decode('UTF-8'))
 
 
 class AbstractCrawler(metaclass=ABCMeta):
@@ -10,6 +41,9 @@ class AbstractCrawler(metaclass=ABCMeta):
     Parameters:
     bearertoken -- a `models.BearerToken`
     """
+    # A `models.Provider.name`, set by concrete crawlers.
+    PROVIDER_NAME = None
+
     def __init__(self, bearertoken):
         self.bearertoken = bearertoken
 
@@ -25,10 +59,25 @@ class AbstractCrawler(metaclass=ABCMeta):
             cl = self._client_cached = self._init_client()
         return cl
 
+    @property
+    def _rate_limiter(self):
+        """
+        A `utils.ratelimit.RateLimiter` for the current `bearertoken`.
+        It is a cached attribute so that it is a singleton.
+        """
+        try:
+            rl = self._rate_limiter_cached
+        except AttributeError:
+            rl = self._rate_limiter_cached = self._init_rate_limiter()
+        return rl
+
     @abstractmethod
     def _init_client(self):
         pass
 
+    def _init_rate_limiter(self):
+        return RateLimiter(self.PROVIDER_NAME, self.bearertoken.id)
+
     @staticmethod
     @abstractmethod
     def _init_response(*args, **kwargs):
@@ -50,7 +99,7 @@ class AbstractCrawler(metaclass=ABCMeta):
                 # Perform the query.
                 # Note: the correctness of the response is checked when creating
                 # the response with _init_response().
-                r = self._client.get(resource_url)
+                r = self._get(resource_url)
 
                 # Parse the response.
                 response = self._init_response(r)
@@ -74,6 +123,183 @@ class AbstractCrawler(metaclass=ABCMeta):
         # completed.
         self._update_updates_cursor(updates_cursor)
 
+    def _get(self, resource_url):
+        """
+        Query `resource_url` with the client, paced by the rate limiter.
+        When the provider refuses the request because the rate limit was exceeded, wait and
+        retry up to settings.RATE_LIMIT_MAX_RETRIES times.
+        """
+        attempt = 0
+        while True:
+            self._rate_limiter.acquire()
+            try:
+                return self._request(resource_url)
+            except RateLimitError as e:
+                if attempt >= settings.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                log.warning("Rate limit exceeded for {}, retrying.".format(
+                    self._rate_limiter.key))
+                self._rate_limiter.block(e.retry_after)
+
+    def _request(self, resource_url):
+        """
+        Query `resource_url` with the client.
+        Raise `RateLimitError` if the provider refused the request because the rate limit was
+        exceeded.
+        """
+        r = self._client.get(resource_url)
+        self._check_rate_limit(r)
+        return r
+
+    def _check_rate_limit(self, r):
+        """
+        Sync the rate limiter with the quota headers of the response `r`.
+        Raise `RateLimitError` if the provider refused the request because the rate limit was
+        exceeded.
+        """
+        self._rate_limiter.update_from_headers(r.headers)
+        if self._is_rate_limited(r):
+            raise RateLimitError('HTTP Status: {}'.format(r.status_code),
+                                 self._get_retry_after(r))
+
+    def _is_rate_limited(self, r):
+        # 429 Too Many Requests.
+        return r.status_code == 429
+
+    @staticmethod
+    def _get_retry_after(r):
+        """
+        Return the seconds to wait before retrying the request refused with the response `r`:
+        the `Retry-After` header (delta-seconds or a HTTP-date) or, when missing (Twitter), the
+        time left until the quota is reset according to the `x-rate-limit-reset` header. None if
+        unknown.
+        """
+        retry_after = r.headers.get('retry-after')
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError, IndexError):
+                log.warning('Invalid Retry-After header: {}'.format(retry_after))
+                return None
+            if retry_at.tzinfo is None:
+                # HTTP-dates are always in GMT.
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            return max(retry_at.timestamp() - time.time(), 0)
+        reset = r.headers.get('x-rate-limit-reset')
+        if reset is not None and int(reset) > time.time():
+            return int(reset) - time.time()
+        return None
+
+    async def run_async(self, http):
+        """
+        Async equivalent of `run()`, to crawl many bearertokens on one event loop (see
+        `asynccrawler.AsyncCrawlerEngine`).
+        Only the HTTP requests are async: the db and Redis work of each page runs in the default
+        executor of the loop, so it never blocks the other crawlers.
+        Crawlers which use it must implement `_sign_request(resource_url)`, which returns the URL
+        and the headers (with the credentials) to use to query `resource_url`. Crawlers with no
+        async client override it instead (see `DropboxCrawler`).
+
+        Parameters:
+        http -- a `aiohttp.ClientSession` shared by all the crawlers.
+        """
+        loop = asyncio.get_event_loop()
+        is_first_loop = True  # for pagination.
+        pagination_cursor = ''  # for pagination.
+        while True:
+            url, headers = await loop.run_in_executor(None, self._prepare_request,
+                                                      pagination_cursor)
+            r = await self._async_get_paced(http, url, headers)
+            response = await loop.run_in_executor(None, self._process_response, r)
+
+            # Pagination.
+            if is_first_loop:
+                updates_cursor = response.updates_cursor
+                is_first_loop = False
+
+            # Continue only in case the response `has_more` items to query.
+            if response.has_more:
+                if hasattr(response, 'pagination_cursor'):
+                    pagination_cursor = response.pagination_cursor
+                continue
+            break
+
+        # Update the updates_cursor only at the end, when everything has been successfully
+        # completed.
+        await loop.run_in_executor(None, self._update_updates_cursor, updates_cursor)
+
+    def _prepare_request(self, pagination_cursor):
+        """
+        Build the URL and the headers of the next request of `run_async()`.
+        """
+        with session_autocommit() as sex:
+            # Add bearertoken to the current session.
+            self.bearertoken = sex.merge(self.bearertoken)
+
+            # The rate limiter reads the bearertoken, so it must be built while the bearertoken
+            # is in a session.
+            if not hasattr(self, '_rate_limiter_cached'):
+                self._rate_limiter_cached = self._init_rate_limiter()
+            resource_url = self._build_resource_url(pagination_cursor)
+            return self._sign_request(resource_url)
+
+    async def _async_get_paced(self, http, url, headers):
+        """
+        Async equivalent of `_get()`.
+        """
+        loop = asyncio.get_event_loop()
+        attempt = 0
+        while True:
+            # The rate limiter talks to Redis, so it runs in the executor too.
+            wait = await loop.run_in_executor(None, self._rate_limiter.try_acquire)
+            while wait:
+                await asyncio.sleep(wait)
+                wait = await loop.run_in_executor(None, self._rate_limiter.try_acquire)
+            try:
+                r = await self._async_get(http, url, headers)
+                await loop.run_in_executor(None, self._check_rate_limit, r)
+                return r
+            except RateLimitError as e:
+                if attempt >= settings.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                log.warning("Rate limit exceeded for {}, retrying.".format(
+                    self._rate_limiter.key))
+                retry_after = e.retry_after
+                if retry_after is None:
+                    retry_after = settings.RATE_LIMIT_DEFAULT_BACKOFF
+                await loop.run_in_executor(None, self._rate_limiter.block, retry_after)
+
+    async def _async_get(self, http, url, headers):
+        """
+        Async equivalent of `self._client.get(url)`.
+        Return a `FetchedResponse`.
+        """
+        async with http.get(url, headers=headers) as r:
+            content = await r.read()
+            return FetchedResponse(r.status, content, r.headers)
+
+    def _process_response(self, r):
+        """
+        Parse a response got in `run_async()` and write its entries to Redis.
+        """
+        with session_autocommit() as sex:
+            # Add bearertoken to the current session.
+            self.bearertoken = sex.merge(self.bearertoken)
+
+            # Note: the correctness of the response is checked when creating
+            # the response with _init_response().
+            response = self._init_response(r)
+            response.parse(self.bearertoken.id)
+
+            self._hook_after_response_parsed(response)
+        return response
+
     @abstractmethod
     def _build_resource_url(self, pagination_cursor):
         pass
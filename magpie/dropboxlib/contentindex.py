@@ -0,0 +1,77 @@
+import json
+
+from magpie.settings import settings
+from utils.diskcache import open_disk_cache
+from utils.redis import open_redis_connection
+
+
+class DropboxContentIndex:
+    """
+    Index of the content of Dropbox files already extracted by Solr.
+
+    It maps the `rev` of a file to the id of a Solr doc which holds the text extracted from that
+    revision (in Redis), and to the extracted fields themselves (in a local on-disk LRU cache of
+    settings.DROPBOX_TEXT_CACHE_MAX_BYTES). So a file whose content has already been indexed
+    (f.i. the same file of a folder shared by many accounts, a file moved to a new path or any
+    file after a reset of the index) is neither downloaded nor extracted again.
+    A `rev` is unique across all the Dropbox accounts, since it includes the id of the namespace
+    (account or shared folder) of the file.
+    Redis keys expire after settings.DROPBOX_CONTENT_INDEX_TTL seconds, and the doc an entry
+    refers to could have been deleted in the meantime: so a hit is only a hint, see
+    `DropboxSolrUpdater.add_duplicate()`.
+    """
+    def __init__(self):
+        self.text_cache = open_disk_cache(settings.DROPBOX_TEXT_CACHE_PATH,
+                                          settings.DROPBOX_TEXT_CACHE_MAX_BYTES)
+
+    @staticmethod
+    def _build_key(rev):
+        return 'dropbox:content:rev:{}'.format(rev)
+
+    def is_known(self, rev):
+        """
+        True if the content of the revision `rev` has (likely) already been extracted.
+        """
+        return bool(rev) and (self.text_cache.has(rev) or self.get(rev) is not None)
+
+    def get(self, rev):
+        """
+        Return the id of the Solr doc holding the content of the revision `rev`, or None.
+        """
+        if not rev:
+            return None
+        doc_id = open_redis_connection().get(self._build_key(rev))
+        return doc_id.decode('UTF-8') if doc_id else None
+
+    def set(self, rev, doc_id):
+        """
+        Record that the Solr doc `doc_id` holds the content of the revision `rev`.
+        """
+        if rev:
+            open_redis_connection().set(self._build_key(rev), doc_id,
+                                        ex=settings.DROPBOX_CONTENT_INDEX_TTL)
+
+    def forget(self, rev):
+        """
+        Forget the Solr doc of the revision `rev`, f.i. because it has been deleted.
+        """
+        if rev:
+            open_redis_connection().delete(self._build_key(rev))
+
+    def get_fields(self, rev):
+        """
+        Return the fields extracted by Solr from the content of the revision `rev` (a Python
+        dictionary) from the on-disk cache, or None.
+        """
+        if not rev:
+            return None
+        data = self.text_cache.get(rev)
+        return json.loads(data.decode('UTF-8')) if data is not None else None
+
+    def set_fields(self, rev, fields):
+        """
+        Store in the on-disk cache the fields extracted by Solr from the content of the revision
+        `rev`.
+        """
+        if rev:
+            self.text_cache.set(rev, json.dumps(fields).encode('UTF-8'))
@@ -1,43 +1,155 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from dropbox.client import DropboxClient  # Dropobox official library
+from dropbox.rest import ErrorResponse
 
 from .response import ApiDropboxResponse
 from crawler import AbstractCrawler
+from magpie.settings import settings
+from utils.db import session_autocommit
+from utils.exceptions import RateLimitError, ImproperlyConfigured
+from models import Provider, BearerToken, DropboxPartition
 
 
 log = logging.getLogger('dropbox')
 
+# Process-wide pool of threads which run the blocking crawls of `DropboxCrawler.run_async()`,
+# so they never take the threads of the default executor of the loop, which the other crawlers
+# need for their db and Redis work.
+_async_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_CRAWLER_DROPBOX_WORKERS)
+
 
 class DropboxCrawler(AbstractCrawler):
     """
     Web crawler to query Dropbox and collect updated files for a `bearertoken`.
 
+    A account is crawled as a whole with `BearerToken.updates_cursor`, or as many independent
+    delta streams, one for each of its partitions (see `models.DropboxPartition`), each with its
+    own cursor. Partitions are crawled in parallel, by up to settings.DROPBOX_DELTA_WORKERS
+    threads. The cursor of a stream is saved after each page, when its entries are safely in
+    Redis, so an interrupted crawl resumes from the last page.
+
     Parameters:
     bearertoken -- a `models.BearerToken`
     """
+    PROVIDER_NAME = Provider.NAME_DROPBOX
+
     def _init_client(self):
-        client = DropboxClient(self.bearertoken.access_token)
-        updates_cursor = self.bearertoken.updates_cursor
-        log.debug('Just read updates_cursor: {}'.format(updates_cursor))
-
-        # Monkey patching the `get` method of client.
-        # `AbstractCrawler` expects `client` to be a `request_oauthlib.OAuth1Session` or a
-        # `request_oauthlib.OAuth1Session` with a `get` method. Here `client` is a
-        # `dropbox.client`, so we monkey patch the `get` method and make it call `delta`.
-        def _delta(self, cursor=updates_cursor, *args, **kwargs):
-            log.debug("Querying DELTA w/ cursor: {}".format(cursor))
-            return client.delta(cursor=cursor, #*args, **kwargs)
-                                path_prefix='/temp/moogletest', *args, **kwargs)  # TODO remove.
-        client.get = _delta
-        return client
+        # All the `DropboxClient`s of the process already share the same pool of keep-alive
+        # connections (the one of `dropbox.rest.RESTClient`), and it is thread-safe.
+        return DropboxClient(self.bearertoken.access_token)
 
     @staticmethod
     def _init_response(*args, **kwargs):
         return ApiDropboxResponse(*args, **kwargs)
 
-    def _hook_after_response_parsed(self, response):
-        # Update the cursor.
-        self.bearertoken.updates_cursor = response.updates_cursor
+    def run(self):
+        """
+        Crawl Dropbox for updated files and write an entry for each file to Redis.
+        """
+        with session_autocommit() as sex:
+            # Add bearertoken to the current session.
+            self.bearertoken = sex.merge(self.bearertoken)
+            self._bearertoken_id = self.bearertoken.id
+            # The client and the rate limiter read the bearertoken, so they must be built while
+            # the bearertoken is in a session (and before the threads start).
+            self._client_cached = self._init_client()
+            self._rate_limiter_cached = self._init_rate_limiter()
+            partitions = [(partition.id, partition.path_prefix)
+                          for partition in self.bearertoken.dropbox_partitions]
+        self._check_partitions([path_prefix for _, path_prefix in partitions])
+
+        if len(partitions) <= 1:
+            self._crawl_partition(*(partitions[0] if partitions else (None, '')))
+            return
+        workers = min(len(partitions), settings.DROPBOX_DELTA_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._crawl_partition, partition_id, path_prefix)
+                       for partition_id, path_prefix in partitions]
+        # Raise the exception of a failed partition, if any. The others have been crawled
+        # anyway: their cursors are saved.
+        for future in futures:
+            future.result()
+
+    async def run_async(self, http):
+        """
+        The `dropbox` library is blocking and it has no async equivalent, so the crawl runs in
+        a pool of threads of its own (`http` is unused).
+        """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(_async_executor, self.run)
+
+    @staticmethod
+    def _check_partitions(path_prefixes):
+        """
+        Partitions must not overlap, otherwise the same file would be indexed twice.
+        """
+        prefixes = [path_prefix.lower().rstrip('/') + '/' for path_prefix in path_prefixes]
+        for prefix in prefixes:
+            if prefix == '/' or any(other != prefix and other.startswith(prefix)
+                                    for other in prefixes):
+                raise ImproperlyConfigured('Overlapping Dropbox partitions: {}'.format(
+                    path_prefixes))
+
+    def _crawl_partition(self, partition_id, path_prefix):
+        """
+        Crawl the delta stream of a partition until it has no more updates.
+
+        Parameters:
+        partition_id -- a `models.DropboxPartition.id`, None for the entire account.
+        path_prefix -- the folder of the partition, '' for the entire account.
+        """
+        cursor = self._read_cursor(partition_id)
+        while True:
+            r = self._get((cursor, path_prefix))
+            response = self._init_response(r, path_prefix)
+            response.parse(self._bearertoken_id)
+
+            cursor = response.updates_cursor
+            self._save_cursor(partition_id, cursor)
+            # Continue only in case the response `has_more` items to query.
+            if not response.has_more:
+                break
+
+    def _read_cursor(self, partition_id):
+        with session_autocommit() as sex:
+            return self._query_cursor_owner(sex, partition_id).updates_cursor
+
+    def _save_cursor(self, partition_id, cursor):
+        # The cursor is the identifier used by Dropbox to keep track of the point in time of the
+        # last synchronization, see `ApiDropboxResponse._build_updates_cursor()`.
+        log.debug('Saving updates_cursor: {}'.format(cursor))
+        with session_autocommit() as sex:
+            self._query_cursor_owner(sex, partition_id).updates_cursor = cursor
+
+    def _query_cursor_owner(self, sex, partition_id):
+        """
+        Return the `DropboxPartition` with id `partition_id`, or the `BearerToken` if None.
+        """
+        if partition_id is None:
+            return sex.query(BearerToken).filter_by(id=self._bearertoken_id).one()
+        return sex.query(DropboxPartition).filter_by(id=partition_id).one()
+
+    def _request(self, resource_url):
+        """
+        `resource_url` is a tuple: (delta cursor, path prefix).
+        The `dropbox` library raises `ErrorResponse` for error responses: 429 and 503 are sent
+        when the rate limit is exceeded: https://www.dropbox.com/developers/core/docs
+        """
+        cursor, path_prefix = resource_url
+        log.debug("Querying DELTA w/ cursor: {} path_prefix: {}".format(cursor, path_prefix))
+        try:
+            return self._client.delta(cursor=cursor or None, path_prefix=path_prefix or None)
+        except ErrorResponse as e:
+            if e.status in (429, 503):
+                raise RateLimitError('HTTP Status: {}'.format(e.status))
+            raise
+
+    def _check_rate_limit(self, r):
+        # Rate limit errors are raised by `_request()`.
+        pass
 
     def _build_resource_url(self, pagination_cursor):
-        return pagination_cursor
\ No newline at end of file
+        # Unused: `run()` builds the requests of each partition.
+        return pagination_cursor, ''
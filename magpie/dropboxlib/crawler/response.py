@@ -44,11 +44,14 @@ class ApiDropboxResponse(AbstractApiResponse):
             ...
         ]
     }
+    `path_prefix` -- the folder of the partition crawled (see `models.DropboxPartition`), '' if
+    the entire account is crawled.
     """
-    def __init__(self, response):
+    def __init__(self, response, path_prefix=''):
         super().__init__(response)
+        self.path_prefix = path_prefix
         # `is_reset` shows that we need to delete all the entry we have stored for the
-        # current user.
+        # current user (or under `path_prefix`).
         self.is_reset = self.response.get('reset', False)
         self.has_more = self.response.get('has_more', False)
         log.debug('Response got: \n{}'.format(json.dumps(response, indent=4)))
@@ -58,7 +61,7 @@ class ApiDropboxResponse(AbstractApiResponse):
 
     def _hook_parse_entire_response(self, redis):
         if self.is_reset:
-            redis.buffer_add_reset()
+            redis.buffer_add_reset(self.path_prefix)
         self._build_updates_cursor()
         self._build_pagination_cursor()
 
@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from utils.exceptions import ImproperlyConfigured
+from .. import DropboxCrawler
+
+
+class DropboxPartitionsTest(TestCase):
+
+    def test_disjoint_partitions(self):
+        """
+        Partitions in different folders are fine, even when a name is a prefix of another one.
+        """
+        DropboxCrawler._check_partitions([])  # The command under test.
+        DropboxCrawler._check_partitions(['/Photos'])
+        DropboxCrawler._check_partitions(['/Photos', '/Documents/', '/Photos 2014'])
+
+    def test_overlapping_partitions(self):
+        """
+        A partition inside another one is rejected, no matter the case and the trailing slash.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            # The command under test.
+            DropboxCrawler._check_partitions(['/Photos', '/photos/2014/'])
+        with self.assertRaises(ImproperlyConfigured):
+            DropboxCrawler._check_partitions(['/Documents/Work', '/DOCUMENTS'])
+
+    def test_root_partition(self):
+        """
+        The root folder overlaps any other partition.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            DropboxCrawler._check_partitions(['/', '/Photos'])  # The command under test.
@@ -1,18 +1,43 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import socket
+import threading
+import time
 from dropbox.client import DropboxClient  # Dropobox official library
+from dropbox.rest import ErrorResponse, RESTSocketError
 
+from magpie.settings import settings
+from models import Provider
+from utils.ratelimit import RateLimiter
 from ..redislist import RedisDropboxDownloadList, RedisDropboxIndexList
+from ..indexer.solrupdater import DropboxSolrUpdater
+from ..contentindex import DropboxContentIndex
 from .dropboxfile import DropboxFile
 
 
 log = logging.getLogger('dropbox')
 
+# Process-wide cap on the downloads in flight, shared by the downloaders of all the bearertokens
+# (f.i. the ones run by the `UpdateScheduler` workers).
+_downloads_semaphore = threading.BoundedSemaphore(settings.DROPBOX_MAX_DOWNLOADS)
+
 
 class DropboxDownloader:
     """
     Download files from Dropbox based on a list previously built by the `DropboxCrawler` and
     stored internally.
 
+    With settings.DROPBOX_DIRECT_INDEXING the downloader indexes the files too: their content
+    is streamed from Dropbox straight to Solr, with no local file and no entry in the index
+    list, and deletes and resets are sent to Solr in the same order as they come.
+
+    Files are downloaded in parallel, by a pool of settings.DROPBOX_DOWNLOAD_WORKERS threads
+    per bearertoken and at most settings.DROPBOX_MAX_DOWNLOADS at the same time in the process,
+    but the entries are moved to the index list in the same order as the download list.
+    Files whose content has already been extracted by Solr (see `DropboxContentIndex`) are not
+    downloaded: their entries are moved to the index list with no `local_name`.
+
     Parameters:
     bearertoken_id -- the id of the `BearToken` owner of the Dropbox account.
     access_token -- the access token of the `BearToken` owner of the Dropbox account.
@@ -26,7 +51,8 @@ class DropboxDownloader:
     def _client(self):
         """
         A `dropbox.DropboxClient` for the current `bearertoken`.
-        It is a cached attribute so that it is a singleton.
+        It is a cached attribute so that it is a singleton. All the `DropboxClient`s of the
+        process share the same pool of keep-alive connections.
         """
         try:
             cl = self._client_cached
@@ -34,41 +60,181 @@ class DropboxDownloader:
             cl = self._client_cached = DropboxClient(self.access_token)
         return cl
 
-    def run(self):
+    @property
+    def _rate_limiter(self):
+        """
+        The `RateLimiter` shared with the `DropboxCrawler` of the same bearertoken.
+        """
+        try:
+            rl = self._rate_limiter_cached
+        except AttributeError:
+            rl = self._rate_limiter_cached = RateLimiter(Provider.NAME_DROPBOX,
+                                                         self.bearertoken_id)
+        return rl
+
+    def run(self, end_of_stream=None):
+        """
+        Download all the files of the download list and move the entries to the index list.
+
+        Parameters:
+        end_of_stream -- the id of the run when streaming, see `AbstractRedisList.iterate()`.
+        """
         print("Downloading for bearerid: ", self.bearertoken_id)
 
         redis_dw = RedisDropboxDownloadList(self.bearertoken_id)
+        if settings.DROPBOX_DIRECT_INDEXING:
+            self._index_directly(redis_dw, end_of_stream)
+            return
+
         redis_ix = RedisDropboxIndexList(self.bearertoken_id)
-        for redis_entry in redis_dw.iterate():
-            # `redis_entry` is a `RedisDropboxEntry` instance.
-
-            # If:
-            #   - `redis_entry.is_del()`: move the entry to the index list
-            #   - `redis_entry.is_reset()`: move the entry to the index list
-            #   - `redis_entry.is_add()`: download the file locally, update
-            #     `redis_entry.remote_path` with the local file name, move the entry to the
-            #     index list
-            #
-            # Bear in mind that:
-            #   - entries with `redis_entry.is_add()` are only files (no dirs cause they have
-            #     already been filtered out)
-            #   - entries with `redis_entry.is_del()`: we don't know if they are files or dir
-            #     but we don't care since during indexing we ask Solr to delete: name and name/*
-            # And a sanity check is run when creating a `RedisDropboxEntry` instance.
-
-            # TODO
-            print(redis_entry.operation, redis_entry.remote_path)
-
-            if redis_entry.is_add():
-                # Download the file. We could use client.get_file or client.get_file_and_metadata,
-                # but under the hood the actual call to the API is the same, cause that basic API
-                # call returns the file plus its metadata.
+        # The entries are removed from the download list in the same transaction which pushes
+        # them to the index list, so a crash never leaves them in both.
+        redis_ix.ack_on_flush(redis_dw)
+        content_index = DropboxContentIndex()
+        # Entries in the same order as the download list, with the future of their download
+        # (None for deletes and resets). They are moved to the index list from the head only,
+        # so a delete never overtakes the add of the same path and vice versa.
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=settings.DROPBOX_DOWNLOAD_WORKERS) as executor:
+            try:
+                for redis_entry in redis_dw.iterate(end_of_stream):
+                    # `redis_entry` is a `RedisDropboxEntry` instance.
+
+                    # If:
+                    #   - `redis_entry.is_del()`: move the entry to the index list
+                    #   - `redis_entry.is_reset()`: move the entry to the index list
+                    #   - `redis_entry.is_add()`: download the file locally, update
+                    #     `redis_entry.remote_path` with the local file name, move the entry to
+                    #     the index list. If its content is already in Solr, move the entry to
+                    #     the index list with no download
+                    #
+                    # Bear in mind that:
+                    #   - entries with `redis_entry.is_add()` are only files (no dirs cause they
+                    #     have already been filtered out)
+                    #   - entries with `redis_entry.is_del()`: we don't know if they are files or
+                    #     dir but we don't care since during indexing we ask Solr to delete: name
+                    #     and name/*
+                    # And a sanity check is run when first reading a field of `redis_entry`.
+
+                    # TODO
+                    print(redis_entry.operation, redis_entry.remote_path)
+
+                    future = None
+                    if redis_entry.is_add() and not content_index.is_known(redis_entry.rev):
+                        future = executor.submit(self._download, redis_entry)
+                    pending.append((redis_entry, future))
+                    self._move_downloaded(pending, redis_ix)
+                self._move_downloaded(pending, redis_ix, wait_all=True)
+            except:
+                # Downloads not started yet are useless now: the entries stay in the download
+                # list and they will be downloaded at the next run.
+                for _, future in pending:
+                    if future:
+                        future.cancel()
+                raise
+        redis_ix.flush_buffer()
+        # Only the end-of-stream markers, if any, are left to remove from the download list.
+        redis_dw.ack()
+
+    @staticmethod
+    def _move_downloaded(pending, redis_ix, wait_all=False):
+        """
+        Move the entries at the head of `pending` which are ready to the index list.
+        Wait for the oldest download while too many entries are pending (twice the workers, so
+        the workers are kept busy), or for all of them if `wait_all` is True.
+        A download failed for good raises its exception here.
+        """
+        max_pending = 2 * settings.DROPBOX_DOWNLOAD_WORKERS
+        while pending:
+            redis_entry, future = pending[0]
+            if future and not future.done() and not wait_all and len(pending) <= max_pending:
+                break
+            pending.popleft()
+            if future:
+                # Update `remote_path` attribute with the local name.
+                redis_entry.local_name = future.result()
+            redis_ix.buffer(redis_entry)
+
+    def _download(self, redis_entry):
+        """
+        Download a file and store it to the local disk, see `_retry()`. It runs in the pool of
+        workers.
+        Return the local name of the file.
+        """
+        def download():
+            with _downloads_semaphore:
+                # Download the file. We could use client.get_file or
+                # client.get_file_and_metadata, but under the hood the actual call to the API
+                # is the same, cause that basic API call returns the file plus its metadata.
                 log.debug('Downloading: {}'.format(redis_entry.remote_path))
                 content, metadata = self._client.get_file_and_metadata(redis_entry.remote_path)
                 file = DropboxFile(content, metadata)
-                file.store_to_disk(self.bearertoken_id)
-                # Update `remote_path` attribute with the local name
-                redis_entry.local_name = file.local_name
+                file.store_to_disk(self.bearertoken_id, DropboxFile.build_local_name(
+                    redis_entry.id, metadata['rev'], redis_entry.remote_path))
+            return file.local_name
 
-            redis_ix.buffer(redis_entry)
-        redis_ix.flush_buffer()
\ No newline at end of file
+        return self._retry(download, redis_entry.remote_path)
+
+    def get_file_and_metadata(self, remote_path):
+        """
+        Request the file `remote_path`, see `_retry()`.
+        Only the request is retried: the content is read by the caller, which must close it.
+        Return the content (a `dropbox.rest.RESTResponse`) and the metadata of the file.
+        """
+        return self._retry(lambda: self._client.get_file_and_metadata(remote_path), remote_path)
+
+    def _retry(self, function, remote_path):
+        """
+        Call `function()`, which downloads the file `remote_path`, paced by the rate limiter and
+        retrying up to settings.DROPBOX_DOWNLOAD_MAX_RETRIES times when Dropbox is unavailable,
+        the rate limit is exceeded or the connection fails.
+        Return what `function()` returns.
+        """
+        attempt = 0
+        while True:
+            self._rate_limiter.acquire()
+            try:
+                return function()
+            except (ErrorResponse, RESTSocketError, ConnectionError, socket.timeout) as e:
+                is_rate_limited = isinstance(e, ErrorResponse) and e.status in (429, 503)
+                is_transient = (not isinstance(e, ErrorResponse) or is_rate_limited or
+                                e.status >= 500)
+                if not is_transient or attempt >= settings.DROPBOX_DOWNLOAD_MAX_RETRIES:
+                    raise
+                log.warning('Downloading {} failed ({!r}), retrying.'.format(remote_path, e))
+                if is_rate_limited:
+                    # 429 and 503 are sent when the rate limit is exceeded:
+                    # https://www.dropbox.com/developers/core/docs
+                    self._rate_limiter.block()
+                else:
+                    time.sleep(settings.DROPBOX_DOWNLOAD_RETRY_BACKOFF * 2 ** attempt)
+                attempt += 1
+
+    def _index_directly(self, redis_dw, end_of_stream):
+        """
+        Send all the entries of the download list to Solr, streaming the content of the files
+        from Dropbox (see settings.DROPBOX_DIRECT_INDEXING).
+        """
+        solr_updater = DropboxSolrUpdater(self.bearertoken_id)
+        try:
+            for redis_entry in redis_dw.iterate(end_of_stream):
+                # `redis_entry` is a `RedisDropboxEntry` instance.
+                if redis_entry.is_del():
+                    log.debug('Solr DEL: {}'.format(redis_entry.remote_path))
+                    solr_updater.delete(redis_entry)
+
+                if redis_entry.is_reset():
+                    log.debug('Solr RESET')
+                    solr_updater.reset()
+
+                if redis_entry.is_add() and not solr_updater.add_duplicate(redis_entry):
+                    log.debug('Downloading and streaming to Solr: {}'.format(
+                        redis_entry.remote_path))
+                    content, metadata = self.get_file_and_metadata(redis_entry.remote_path)
+                    # `content` is closed by `add_stream()`, even if it fails.
+                    solr_updater.add_stream(redis_entry, content, metadata)
+            # The entries are going to be removed from Redis: they must be safely in Solr.
+            solr_updater.commit(durable=True)
+        finally:
+            solr_updater.close()
+        redis_dw.ack()
@@ -1,6 +1,8 @@
 import json
-from os.path import normpath, join, exists, split, basename
-from os import mkdir
+from os.path import normpath, join, exists, splitext
+from os import makedirs, remove, replace
+from shutil import copyfileobj
+from tempfile import mkstemp
 import logging
 
 from magpie.settings import settings
@@ -37,49 +39,50 @@ class DropboxFile:
         self.metadata = metadata
         self.local_name = ''
 
-    def store_to_disk(self, bearertoken_id):
-        content_file_path, metadata_file_path = self._find_valid_local_name(bearertoken_id)
-        self.local_name = basename(content_file_path)
-        log.debug('Storing to disk: {}'.format(self.local_name))
-
-        with self.content,\
-             open(content_file_path, 'wb') as fout,\
-             open(metadata_file_path, 'w') as metaout:
-            # TODO shall we read chunk by chunk and write it? Do we have performance issue
-            # TODO if the file is 10MB (10Mb is the max file size)?
-            fout.write(self.content.read())
-            metaout.write(json.dumps(self.metadata, indent=4))
+    @staticmethod
+    def build_local_name(entry_id, rev, remote_path):
+        """
+        Build the local name of the file of a entry, unique for its id (that is its remote path)
+        and its revision, so it is never taken by the file of another entry: a missing file means
+        that this very revision has already been posted to Solr (see
+        `DropboxSolrUpdater.add()`). The extension is kept, since Solr uses it to detect the type
+        of the file.
+        """
+        return '{}-{}{}'.format(entry_id, rev, splitext(remote_path)[1].lower())
 
-    def _find_valid_local_name(self, bearertoken_id):
+    def store_to_disk(self, bearertoken_id, local_name):
         """
-        Find a valid local name for the current file. In case a file with the same name already
-        exists, then a number is added to the file name in order to make it unique.
+        Store the file to the local disk, named `local_name` (see `build_local_name()`).
+        The file and its metadata file are written to temp files and then renamed, so a file
+        with the final name is always complete, even if the same file is downloaded twice at the
+        same time.
         """
         # Create user folder inside DROPBOX_TEMP_STORAGE_PATH, named after the bearertoken_id.
         local_folder = normpath(join(settings.DROPBOX_TEMP_STORAGE_PATH, str(bearertoken_id)))
-        if not exists(local_folder):
-            mkdir(local_folder)
-
-        # The remote file path is in metadata['path'].
-        # metadata['path'] must exists otherwise it is a major issue.
-        # It must be a file (we download only files, not folders) so it must not end with a '/'
-        # otherwise this will compromise the os.split.
-        remote_path = self.metadata['path']
-        assert not remote_path.endswith('/')
-
-        # Split a path in a tuple: (until last '/' excluded, after last '/' excluded)
-        _, file_name = split(self.metadata['path'])
-        local_file_path = normpath(join(local_folder, file_name))
+        makedirs(local_folder, exist_ok=True)
+        content_file_path = join(local_folder, local_name)
+        metadata_file_path = '{}.metadata'.format(content_file_path)
+        self.local_name = local_name
+        log.debug('Storing to disk: {}'.format(self.local_name))
 
-        # We put all files in a single folder, we don't recreate the entire folders structure
-        # of a user's dropbox account; so there can be file name clashes.
-        # Thus we have to get an available local file name by appending a number to the end
-        # of the filename.
-        i = ''
-        while exists(local_file_path + str(i)):
-            if i == '':
-                i = 0
-            else:
-                i += 1
-        local_file_path = local_file_path + str(i)
-        return local_file_path, '{}.metadata'.format(local_file_path)
\ No newline at end of file
+        tmp_paths = []
+        try:
+            with self.content:
+                for file_path in (content_file_path, metadata_file_path):
+                    fd, tmp_path = mkstemp(dir=local_folder, suffix='.tmp')
+                    tmp_paths.append(tmp_path)
+                    with open(fd, 'wb') as fout:
+                        if file_path == content_file_path:
+                            # Write chunk by chunk, so the file is never entirely in memory.
+                            copyfileobj(self.content, fout, settings.FILE_CHUNK_SIZE)
+                        else:
+                            fout.write(json.dumps(self.metadata, indent=4).encode('utf-8'))
+            # The metadata file first: the content file is the one checked by the indexer.
+            replace(tmp_paths[1], metadata_file_path)
+            replace(tmp_paths[0], content_file_path)
+        except:
+            # Do not leave a partial file around: the download is going to be retried.
+            for tmp_path in tmp_paths:
+                if exists(tmp_path):
+                    remove(tmp_path)
+            raise
@@ -1,14 +1,22 @@
 from os.path import splitext, basename
 from abc import ABCMeta
 import hashlib
+import json
 
 from utils.exceptions import InconsistentItemError, EntryNotToBeIndexed
 from magpie.settings import settings
 from redislist import AbstractRedisEntry
 
 
+# The metadata got from Dropbox which are stored with a entry (in `metadata_json`): only the ones
+# needed to index the file. `path` has the original case of the path, unlike the remote path.
+STORED_METADATA = ['path', 'rev', 'mime_type', 'bytes', 'modified']
+
+
 class AbstractDropboxEntry(metaclass=ABCMeta):
-    __all__ = ['id', 'remote_path', 'local_name', 'operation']
+    # `rev` and `metadata_json` (the `STORED_METADATA` got from Dropbox, in json) are empty for
+    # deletes and resets.
+    __all__ = ['id', 'remote_path', 'local_name', 'operation', 'rev', 'metadata_json']
 
 
 class ApiDropboxEntry(AbstractDropboxEntry):
@@ -71,7 +79,11 @@ class ApiDropboxEntry(AbstractDropboxEntry):
         self.id = self._build_id(self.remote_path)
         self.operation = self._find_operation()
         self.local_name = ''
-
+        self.rev = self.metadata['rev'] if self.metadata else ''
+        self.metadata_json = ''
+        if self.metadata:
+            self.metadata_json = json.dumps({name: self.metadata[name]
+                                             for name in STORED_METADATA if name in self.metadata})
 
     @staticmethod
     def _sanity_check(entry_list):
@@ -186,6 +198,16 @@ class RedisDropboxEntry(AbstractDropboxEntry, AbstractRedisEntry):
         """True if the `operation` is 'X' and remote_path is 'RESET'."""
         return self.remote_path == 'RESET'
 
+    def get_metadata(self):
+        """
+        Return the metadata got from Dropbox when crawling (only the `STORED_METADATA`), a
+        Python dictionary, or None if unknown (deletes, resets and entries stored before it was
+        recorded).
+        """
+        if not self.metadata_json:
+            return None
+        return json.loads(self.metadata_json)
+
     def __str__(self):
         return '<{}(operation={}, remote_path={})>'.format(
             self.__class__.__name__, self.operation, self.remote_path
@@ -10,6 +10,8 @@ log = logging.getLogger('dropbox')
 class DropboxIndexer:
     """
     Read all Dropbox entries stored in Redis for a `bearertoken_id` and send them to Solr.
+    Files not downloaded because their content was already known are added with the content
+    copied from Solr, or downloaded and streamed to Solr if it is not there any more.
 
     Parameters:
     bearertoken_id -- a `models.BearerToken.id`.
@@ -19,34 +21,67 @@ class DropboxIndexer:
         self.bearertoken_id = bearertoken_id
         self.access_token = access_token
 
-    def run(self):
+    @property
+    def _downloader(self):
+        """
+        A `DropboxDownloader` for the current `bearertoken`, to download the files whose content
+        is not in Solr any more with the same retries and rate limiter.
+        """
+        try:
+            dw = self._downloader_cached
+        except AttributeError:
+            # Import here to avoid circular imports.
+            from ..downloader import DropboxDownloader
+            dw = self._downloader_cached = DropboxDownloader(self.bearertoken_id,
+                                                             self.access_token)
+        return dw
+
+    def run(self, end_of_stream=None):
+        """
+        Send all the entries of the index list to Solr.
+
+        Parameters:
+        end_of_stream -- the id of the run when streaming, see `AbstractRedisList.iterate()`.
+        """
         redis = RedisDropboxIndexList(self.bearertoken_id)
         solr_updater = DropboxSolrUpdater(self.bearertoken_id)
-        for redis_entry in redis.iterate():
-            # `redis_entry` is a `RedisDropboxEntry` instance.
-
-            # If:
-            #   - `redis_entry.is_del()`: delete the file from Sorl
-            #   - `redis_entry.is_reset()`: delete the entire index from Solr
-            #   - `redis_entry.is_add()`: add the file to Solr (the file has already
-            #     been downloaded locally)
-            #
-            # Bear in mind that:
-            #   - entries with `redis_entry.is_add()` are only files (no dirs cause they have
-            #     already been filtered out)
-            #   - entries with `redis_entry.is_del()`: we don't know if they are files or dir
-            #     but we don't care since during indexing we ask Solr to delete: name and name/*
-            # And a sanity check is run when creating a `RedisDropboxEntry` instance.
-
-            if redis_entry.is_del():
-                log.debug('Solr DEL: {}'.format(redis_entry.remote_path))
-                solr_updater.delete(redis_entry)
-
-            if redis_entry.is_reset():
-                log.debug('Solr RESET')
-                solr_updater.reset()
-
-            if redis_entry.is_add():
-                log.debug('Solr ADD: {}'.format(redis_entry.remote_path))
-                solr_updater.add(redis_entry)
-        solr_updater.commit()
\ No newline at end of file
+        try:
+            for redis_entry in redis.iterate(end_of_stream):
+                # `redis_entry` is a `RedisDropboxEntry` instance.
+
+                # If:
+                #   - `redis_entry.is_del()`: delete the file from Sorl
+                #   - `redis_entry.is_reset()`: delete the entire index from Solr
+                #   - `redis_entry.is_add()`: add the file to Solr (the file has already
+                #     been downloaded locally, unless its content was already in Solr)
+                #
+                # Bear in mind that:
+                #   - entries with `redis_entry.is_add()` are only files (no dirs cause they have
+                #     already been filtered out)
+                #   - entries with `redis_entry.is_del()`: we don't know if they are files or
+                #     dir but we don't care since during indexing we ask Solr to delete: name and
+                #     name/*
+                # And a sanity check is run when first reading a field of `redis_entry`.
+
+                if redis_entry.is_del():
+                    log.debug('Solr DEL: {}'.format(redis_entry.remote_path))
+                    solr_updater.delete(redis_entry)
+
+                if redis_entry.is_reset():
+                    log.debug('Solr RESET')
+                    solr_updater.reset()
+
+                if redis_entry.is_add():
+                    log.debug('Solr ADD: {}'.format(redis_entry.remote_path))
+                    if redis_entry.local_name:
+                        solr_updater.add(redis_entry)
+                    elif not solr_updater.add_duplicate(redis_entry):
+                        # The doc holding its content has been deleted in the meantime.
+                        content, metadata = self._downloader.get_file_and_metadata(
+                            redis_entry.remote_path)
+                        solr_updater.add_stream(redis_entry, content, metadata)
+            # The entries are going to be removed from Redis: they must be safely in Solr.
+            solr_updater.commit(durable=True)
+        finally:
+            solr_updater.close()
+        redis.ack()
@@ -1,23 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
-from os.path import join, normpath
+from os.path import join, normpath, exists
 import os
 import logging
+import re
 
 from utils.dates import dropbox_date_to_solr_date
 from magpie.settings import settings
 from models import Provider
 from utils.solr import Solr, escape_solr_query, CORE_NAMES
+from ..contentindex import DropboxContentIndex
 
 
 log = logging.getLogger('dropbox')
 
 
 class DropboxSolrUpdater:
+    """
+    Send Dropbox files to add, files and folders to delete and resets to Solr.
+
+    Consecutive deletes are buffered and sent in a single request (with many queries), when a
+    file is added, on a reset, on commit or when they are settings.SOLR_DELETE_BATCH_SIZE.
+    Deletes of paths inside a folder already deleted are skipped, and deletes followed by a reset
+    are dropped.
+
+    Files are posted to Solr (whose Tika extraction is slow, seconds for a PDF) by a pool of
+    settings.DROPBOX_EXTRACT_WORKERS threads, so many extract requests are in flight at the same
+    time. The order of the operations on the same path is preserved: a delete (or reset) is sent
+    only when the in-flight adds of the paths it covers are over, and a file is added again only
+    when its previous add is over.
+
+    Files whose content has already been extracted (see `DropboxContentIndex`) can be added with
+    no download and no extraction, see `add_duplicate()`.
+
+    Parameters:
+    bearertoken_id -- a `models.BearerToken.id`.
+    """
     CORE_NAME = CORE_NAMES[Provider.NAME_DROPBOX]
+    # Stored fields extracted by Solr from the content of a file.
+    EXTRACTED_FIELDS = ['title', 'subject', 'description', 'comments', 'author', 'keywords',
+                        'category', 'content_type', 'last_modified', 'links', 'content']
 
     def __init__(self, bearertoken_id):
         self.bearertoken_id = bearertoken_id
         self.solr = Solr(self.CORE_NAME)
+        self.content_index = DropboxContentIndex()
+        # Lowercase remote paths to delete, not sent to Solr yet.
+        self._pending_deletes = []
+        # Adds in flight: `concurrent.futures.Future`s by lowercase remote path.
+        self._in_flight = {}
+        self._executor = None
+        if settings.DROPBOX_EXTRACT_WORKERS > 1:
+            self._executor = ThreadPoolExecutor(max_workers=settings.DROPBOX_EXTRACT_WORKERS)
 
     def add(self, redis_entry, commit=False):
         """
@@ -26,21 +60,228 @@ class DropboxSolrUpdater:
         Parameters:
         redis_entry -- a `RedisDropboxEntry` instance.
         """
+        # The file could have been deleted and then added again: deletes go first.
+        self.flush_deletes()
+
         local_file_path = normpath(join(settings.DROPBOX_TEMP_STORAGE_PATH,
                                         str(self.bearertoken_id),
                                         redis_entry.local_name))
+        if not exists(local_file_path):
+            # The file has already been posted (and deleted) by a previous run which died before
+            # acknowledging its Redis entries (see `AbstractRedisList.ack()`). Local names are
+            # unique for a entry and its revision (see `DropboxFile.build_local_name()`), so it
+            # was this very file.
+            log.warning('File already posted to Solr: {}'.format(local_file_path))
+            return
 
         # Build Solr doc.
         doc = self._convert_redis_entry_to_solr_doc(redis_entry, local_file_path)
+        self._post(redis_entry.remote_path, self._post_downloaded_file, doc, local_file_path)
+
+        if commit:
+            self.commit()
+
+    def add_stream(self, redis_entry, content, metadata, commit=False):
+        """
+        Add a new file to the Solr index for the current `bearertoken_id`, streaming its content
+        from Dropbox with no local file (see settings.DROPBOX_DIRECT_INDEXING).
+
+        Parameters:
+        redis_entry -- a `RedisDropboxEntry` instance.
+        content -- the content of the file, a file-like object got from Dropbox. It is closed
+            when posted, or if the post fails.
+        metadata -- the metadata of the file got from Dropbox, a Python dictionary.
+        """
+        try:
+            # The file could have been deleted and then added again: deletes go first.
+            self.flush_deletes()
+
+            doc = self._build_solr_doc(redis_entry, metadata)
+            self._post(redis_entry.remote_path, self._post_stream, doc, content, metadata)
+        except:
+            content.close()
+            raise
+
+        if commit:
+            self.commit()
+
+    def add_duplicate(self, redis_entry, commit=False):
+        """
+        Add a new file whose content has already been extracted by Solr (see
+        `DropboxContentIndex`), copying the extracted fields from the doc which holds them: the
+        file is neither downloaded nor extracted again.
+        Return False if the content is unknown: the file must be downloaded and added.
+
+        Parameters:
+        redis_entry -- a `RedisDropboxEntry` instance.
+        """
+        metadata = redis_entry.get_metadata()
+        if not metadata:
+            return False
+        fields = self._get_extracted_fields(redis_entry.rev)
+        if fields is None:
+            return False
+
+        # The file could have been deleted and then added again: deletes go first.
+        self.flush_deletes()
+
+        doc = self._build_fields(redis_entry, metadata)
+        doc.update(fields)
+        log.debug('Solr ADD (content of rev {}): {}'.format(redis_entry.rev,
+                                                            redis_entry.remote_path))
+        self._post(redis_entry.remote_path, self.solr.update, [doc], 'json', False)
+
+        if commit:
+            self.commit()
+        return True
+
+    def _get_extracted_fields(self, rev):
+        """
+        Return the fields extracted by Solr from the content of the revision `rev`, or None if
+        unknown. They are read from the on-disk cache or else from the Solr doc which holds them.
+        """
+        fields = self.content_index.get_fields(rev)
+        if fields is not None:
+            return fields
+
+        source_id = self.content_index.get(rev)
+        if not source_id:
+            return None
+        # The doc could have been deleted or updated since its content was indexed.
+        docs = self.solr.get_docs([source_id], ['rev'] + self.EXTRACTED_FIELDS)
+        if not docs or docs[0].get('rev') != rev:
+            self.content_index.forget(rev)
+            return None
+        fields = {name: value for name, value in docs[0].items()
+                  if name in self.EXTRACTED_FIELDS}
+        self.content_index.set_fields(rev, fields)
+        return fields
+
+    def _remember_content(self, doc_id, rev, fields=None):
+        """
+        Record the content of a file just extracted and added to Solr, and its extracted
+        `fields` if known, see `DropboxContentIndex`. It runs in the pool of workers, if any.
+        """
+        if not rev:
+            return
+        self.content_index.set(rev, doc_id)
+        if fields is not None:
+            self.content_index.set_fields(rev, fields)
+
+    @classmethod
+    def _build_extracted_fields(cls, text, metadata):
+        """
+        Build the `EXTRACTED_FIELDS` of a file from its text and its metadata extracted by Solr
+        with no indexing (see `utils.solr.Solr.extract_file()`), like the extract handler does
+        when indexing. `links` are not extracted in text format.
+        """
+        fields = {'content': text}
+        for name, values in metadata.items():
+            # Like the `lowernames` option of the extract handler: 'Last-Modified' is mapped to
+            # 'last_modified'.
+            name = re.sub(r'[^a-z0-9]', '_', name.lower())
+            if name in cls.EXTRACTED_FIELDS and name not in fields:
+                fields[name] = values
+        return fields
+
+    def _post_extracted(self, doc, text, metadata):
+        """
+        Add a file whose text and metadata have been extracted by Solr with no indexing, as a
+        JSON doc made of the literals of `doc` and the extracted fields, and record its content
+        (the extracted fields too). It runs in the pool of workers, if any.
+        """
+        fields = self._build_extracted_fields(text, metadata)
+        doc = {name[len('literal.'):]: value for name, value in doc.items()}
+        doc.update(fields)
+        self.solr.update([doc], 'json', False)
+        self._remember_content(doc['id'], doc.get('rev'), fields)
+
+    def _post(self, remote_path, function, *args):
+        """
+        Run `function(*args)` which posts the file `remote_path` to Solr, in the pool of workers
+        if any (see `DropboxSolrUpdater`).
+        """
+        if not self._executor:
+            function(*args)
+            return
+
+        path = remote_path.lower()
+        # The previous add of the same file must be over.
+        self._wait_in_flight([path])
+        # Bound the number of adds in flight.
+        while len(self._in_flight) >= settings.DROPBOX_EXTRACT_WORKERS:
+            done, _ = wait(self._in_flight.values(), return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self._in_flight[path] = self._executor.submit(function, *args)
+
+    def _post_downloaded_file(self, doc, local_file_path):
+        """
+        Post a downloaded file to Solr and delete it (and its metadata file) from the local disk.
+        It runs in the pool of workers, if any.
+        """
+        self._post_file(doc, local_file_path)
+        os.remove(local_file_path)  # Delete the downloaded file.
+        os.remove(local_file_path + '.metadata')  # Delete the metadata file.
+
+    def _post_file(self, doc, local_file_path):
+        """
+        Post a file to Solr.
+        """
         log.debug('Posting file to Solr: {}'.format(self.solr.url) +
                   '\nDoc: {}'.format(doc) +
                   '\nFile: {}'.format(local_file_path))
+        if settings.DROPBOX_TEXT_CACHE_MAX_BYTES:
+            # Extracted with no indexing, so the extracted text is got back for the cache.
+            self._post_extracted(doc, *self.solr.extract_file(local_file_path))
+            return
         self.solr.add_file(doc, local_file_path)
-        os.remove(local_file_path)  # Delete the downloaded file.
-        os.remove(local_file_path + '.metadata')  # Delete the metadata file.
+        self._remember_content(doc['literal.id'], doc.get('literal.rev'))
 
-        if commit:
-            self.commit()
+    def _post_stream(self, doc, content, metadata):
+        """
+        Post the content of a file downloaded from Dropbox to Solr.
+        It runs in the pool of workers, if any.
+        """
+        log.debug('Streaming file to Solr: {}'.format(self.solr.url) +
+                  '\nDoc: {}'.format(doc))
+        try:
+            if settings.DROPBOX_TEXT_CACHE_MAX_BYTES:
+                # Extracted with no indexing, so the extracted text is got back for the cache.
+                extracted = self.solr.extract_stream(metadata['path'], content, metadata['bytes'])
+            else:
+                self.solr.add_stream(doc, metadata['path'], content, metadata['bytes'])
+        finally:
+            content.close()
+        if settings.DROPBOX_TEXT_CACHE_MAX_BYTES:
+            self._post_extracted(doc, *extracted)
+            return
+        self._remember_content(doc['literal.id'], doc.get('literal.rev'))
+
+    def _wait_in_flight(self, paths=None):
+        """
+        Wait for the adds in flight of the files in `paths` or inside the folders in `paths`.
+        Wait for all the adds in flight if `paths` is None.
+        Raise the exception of a failed add, if any.
+        """
+        if paths is None:
+            futures = list(self._in_flight.values())
+        else:
+            prefixes = tuple(path + '/' for path in paths)
+            futures = [future for path, future in self._in_flight.items()
+                       if path in paths or path.startswith(prefixes)]
+        if futures:
+            wait(futures)
+            self._collect(futures)
+
+    def _collect(self, futures):
+        """
+        Forget the adds in flight which are over. Raise the exception of a failed add, if any.
+        """
+        futures = set(futures)
+        self._in_flight = {path: future for path, future in self._in_flight.items()
+                           if future not in futures}
+        for future in futures:
+            future.result()
 
     def _convert_redis_entry_to_solr_doc(self, redis_entry, local_file_path):
         # Build the metadata-file path.
@@ -50,25 +291,83 @@ class DropboxSolrUpdater:
             data = fin.read()
         # Load the content (json) of the metadata-file in a Python dictionary.
         metadata = json.loads(data)
+        return self._build_solr_doc(redis_entry, metadata)
+
+    def _build_solr_doc(self, redis_entry, metadata):
+        """
+        Build the Solr doc (as literals for the extract handler) of a file.
+
+        Parameters:
+        redis_entry -- a `RedisDropboxEntry` instance.
+        metadata -- the metadata of the file got from Dropbox, a Python dictionary.
+        """
+        return {'literal.{}'.format(name): value
+                for name, value in self._build_fields(redis_entry, metadata).items()}
 
+    def _build_fields(self, redis_entry, metadata):
+        """
+        Build the fields of the Solr doc of a file, the ones not extracted from its content.
+        """
         doc = dict()
-        doc['literal.bearertoken_id'] = self.bearertoken_id
-        doc['literal.id'] = '{}:{}'.format(self.bearertoken_id, redis_entry.id)
-        doc['literal.remote_path'] = metadata['path']
-        doc['literal.modified_at'] = dropbox_date_to_solr_date(metadata['modified'])
-        doc['literal.mime_type'] = metadata['mime_type']
-        doc['literal.bytes'] = metadata['bytes']
+        doc['bearertoken_id'] = self.bearertoken_id
+        doc['id'] = '{}:{}'.format(self.bearertoken_id, redis_entry.id)
+        doc['remote_path'] = metadata['path']
+        doc['modified_at'] = dropbox_date_to_solr_date(metadata['modified'])
+        doc['mime_type'] = metadata['mime_type']
+        doc['bytes'] = metadata['bytes']
+        doc['rev'] = metadata['rev']
 
         return doc
 
     def delete(self, redis_entry, commit=False):
         """
-        Delete a Dropbox file from the Solr index for the current `bearertoken_id`.
+        Delete a Dropbox file (or folder) from the Solr index for the current `bearertoken_id`.
+        The delete is buffered, see `DropboxSolrUpdater`.
 
         Parameters:
         redis_entry -- a `RedisDropboxEntry` instance.
         """
+        # Paths are case-insensitive in Dropbox.
+        path = redis_entry.remote_path.lower().rstrip('/')
+
+        # Skip the delete if the path or a parent folder is already going to be deleted.
+        parent = path
+        while True:
+            if parent in self._pending_deletes:
+                log.debug('Solr DEL skipped, covered by: {}'.format(parent))
+                return
+            if '/' not in parent:
+                break
+            parent = parent.rsplit('/', 1)[0]
+
+        # Drop the pending deletes of paths inside this one.
+        prefix = path + '/'
+        self._pending_deletes = [p for p in self._pending_deletes if not p.startswith(prefix)]
+        self._pending_deletes.append(path)
+        if len(self._pending_deletes) >= settings.SOLR_DELETE_BATCH_SIZE:
+            self.flush_deletes()
+
+        if commit:
+            self.commit()
+
+    def flush_deletes(self):
+        """
+        Send all the pending deletes to Solr, in a single request.
+        """
+        if self._pending_deletes:
+            # The adds of the files to delete must be over.
+            self._wait_in_flight(self._pending_deletes)
+            self.solr.delete_by_queries([self._build_delete_query(path)
+                                         for path in self._pending_deletes])
+        self._pending_deletes = []
+
+    def _build_delete_query(self, path):
+        """
+        Build the query to delete `path` from the Solr index.
 
+        Parameters:
+        path -- the lowercase remote path of a Dropbox file or folder.
+        """
         # We want to delete the specific entry and all its children, in case of any.
         # Note: '/' is a keyword in Solr, so we need to escape it this way: '\/'.
         # Note: keep in mind that there is no way to know if the entry is a folder or a file (cause
@@ -82,24 +381,38 @@ class DropboxSolrUpdater:
         #
         # Note: this is smart because we don't delete: /folder1/folder2/folder 30
 
-        root = escape_solr_query(redis_entry.remote_path)
+        root = escape_solr_query(path)
         children = '{}\/*'.format(root)
-        q = 'remote_path_ci:({} OR {}) '.format(root.lower(), children.lower()) + \
+        return 'remote_path_ci:({} OR {}) '.format(root, children) + \
             'AND bearertoken_id:{}'.format(self.bearertoken_id)
-        self.solr.delete_by_query(q)
-
-        if commit:
-            self.commit()
 
     def reset(self, commit=False):
         """
         Delete all files from the Solr index for the current `bearertoken_id`.
         """
+        # The pending deletes are useless: everything is going to be deleted.
+        self._pending_deletes = []
+        self._wait_in_flight()
         q = 'bearertoken_id:{}'.format(self.bearertoken_id)
         self.solr.delete_by_query(q)
 
         if commit:
             self.commit()
 
-    def commit(self):
-        self.solr.commit()
\ No newline at end of file
+    def commit(self, durable=False):
+        """
+        Wait for the adds in flight, send the pending deletes and commit, see
+        `utils.solr.Solr.commit()`.
+        """
+        self._wait_in_flight()
+        self.flush_deletes()
+        self.solr.commit(durable)
+
+    def close(self):
+        """
+        Stop the pool of workers, if any, waiting for the adds in flight. Their errors are
+        ignored: call `commit()` first to make sure they succeeded.
+        """
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self._in_flight = {}
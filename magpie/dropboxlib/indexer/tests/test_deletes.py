@@ -0,0 +1,70 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from ..solrupdater import DropboxSolrUpdater
+
+
+###################################################################################################
+# NOTE: unit test must not depend on external resources like Solr
+# We must use mocks here!
+###################################################################################################
+
+
+class DropboxSolrUpdaterDeletesTest(TestCase):
+
+    def setUp(self):
+        self.bearertoken_id = '7777777xxx'
+        self.solr_updater = DropboxSolrUpdater(self.bearertoken_id)
+        self.solr_updater.solr = Mock()
+        self.addCleanup(self.solr_updater.close)
+
+    def delete(self, remote_path):
+        redis_entry = Mock()
+        redis_entry.remote_path = remote_path
+        self.solr_updater.delete(redis_entry)
+
+    def get_deleted_paths(self):
+        """
+        Return the lists of paths deleted by each request sent to Solr.
+        """
+        return [[query.split(' OR ')[0] for query in call[0][0]]
+                for call in self.solr_updater.solr.delete_by_queries.call_args_list]
+
+    def test_deletes_coalesced(self):
+        """
+        Consecutive deletes are sent in a single request, when flushed.
+        """
+        self.delete('/Folder1/file1')
+        self.delete('/Folder2/file2.txt')
+        self.assertFalse(self.solr_updater.solr.delete_by_queries.called)
+
+        self.solr_updater.flush_deletes()  # The command under test.
+
+        self.assertEqual(self.get_deleted_paths(), [['remote_path_ci:(\\/folder1\\/file1',
+                                                     'remote_path_ci:(\\/folder2\\/file2.txt']])
+
+    def test_covered_deletes_skipped(self):
+        """
+        Deletes of paths inside a folder which is going to be deleted are skipped, no matter
+        the order.
+        """
+        self.delete('/Folder1/folder2/file1')
+        self.delete('/Folder1/folder2/')
+        self.delete('/folder1/FOLDER2/folder 3/file2.txt')
+        self.delete('/Folder1/folder22')
+        self.solr_updater.flush_deletes()  # The command under test.
+
+        self.assertEqual(self.get_deleted_paths(), [['remote_path_ci:(\\/folder1\\/folder2',
+                                                     'remote_path_ci:(\\/folder1\\/folder22']])
+
+    def test_deletes_dropped_on_reset(self):
+        """
+        Deletes followed by a reset are never sent.
+        """
+        self.delete('/Folder1/file1')
+        self.solr_updater.reset()  # The command under test.
+        self.solr_updater.flush_deletes()
+
+        self.assertFalse(self.solr_updater.solr.delete_by_queries.called)
+        self.solr_updater.solr.delete_by_query.assert_called_once_with(
+            'bearertoken_id:{}'.format(self.bearertoken_id))
@@ -0,0 +1,42 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from ..solrupdater import DropboxSolrUpdater
+
+
+###################################################################################################
+# NOTE: unit test must not depend on external resources like Solr
+# We must use mocks here!
+###################################################################################################
+
+
+class DropboxSolrUpdaterExtractTest(TestCase):
+
+    def setUp(self):
+        self.bearertoken_id = '7777777xxx'
+        self.solr_updater = DropboxSolrUpdater(self.bearertoken_id)
+        self.solr_updater.solr = Mock()
+        self.solr_updater.content_index = Mock()
+        self.addCleanup(self.solr_updater.close)
+
+    def test_post_extracted(self):
+        """
+        A file extracted with no indexing is added as a JSON doc, and its extracted fields are
+        cached with no further request to Solr.
+        """
+        doc = {'literal.id': '7777777xxx:1', 'literal.rev': '3b0740265d3a0',
+               'literal.remote_path': '/Folder1/file1.pdf'}
+        metadata = {'Content-Type': ['application/pdf'], 'Author': ['Jane'],
+                    'Last-Modified': ['2014-01-27T21:09:36Z'], 'X-Parsed-By': ['PDFParser']}
+        self.solr_updater._post_extracted(doc, 'hello', metadata)  # The command under test.
+
+        fields = {'content': 'hello', 'content_type': ['application/pdf'], 'author': ['Jane'],
+                  'last_modified': ['2014-01-27T21:09:36Z']}
+        posted = dict(fields, id='7777777xxx:1', rev='3b0740265d3a0',
+                      remote_path='/Folder1/file1.pdf')
+        self.solr_updater.solr.update.assert_called_once_with([posted], 'json', False)
+        self.solr_updater.content_index.set.assert_called_once_with('3b0740265d3a0',
+                                                                    '7777777xxx:1')
+        self.solr_updater.content_index.set_fields.assert_called_once_with('3b0740265d3a0',
+                                                                           fields)
+        self.assertFalse(self.solr_updater.solr.get_docs.called)
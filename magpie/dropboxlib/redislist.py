@@ -1,8 +1,8 @@
 import datetime
 from unittest.mock import Mock
 
-from redislist import AbstractRedisList
-from .entry import RedisDropboxEntry, AbstractDropboxEntry
+from redislist import AbstractRedisList, AbstractRedisStream
+from .entry import RedisDropboxEntry, AbstractDropboxEntry, ApiDropboxEntry
 
 
 class RedisDropboxDownloadList(AbstractRedisList):
@@ -22,10 +22,19 @@ class RedisDropboxDownloadList(AbstractRedisList):
     def _init_redis_provider_entry(*args, **kwargs):
         return RedisDropboxEntry(*args, **kwargs)
 
-    def buffer_add_reset(self):
+    def buffer_add_reset(self, path_prefix=''):
         """
         Add a reset instruction to Redis' download list (through a pipeline which is a buffer).
+
+        Parameters:
+        path_prefix -- the folder to reset when crawling a partition of the account (see
+            `models.DropboxPartition`), default: the entire account.
         """
+        if path_prefix:
+            # Only the files inside the folder must be deleted: it is a delete of the folder.
+            self.buffer(ApiDropboxEntry([path_prefix, None]))
+            return
+
         entry = Mock()
         entry.__all__ = AbstractDropboxEntry.__all__
         epoch = datetime.datetime.utcfromtimestamp(0)
@@ -34,6 +43,8 @@ class RedisDropboxDownloadList(AbstractRedisList):
         entry.remote_path = 'RESET'
         entry.local_name = 'RESET'
         entry.operation = 'X'
+        entry.rev = ''
+        entry.metadata_json = ''
         self.buffer(entry)
 
 
@@ -52,4 +63,26 @@ class RedisDropboxIndexList(AbstractRedisList):
 
     @staticmethod
     def _init_redis_provider_entry(*args, **kwargs):
-        return RedisDropboxEntry(*args, **kwargs)
\ No newline at end of file
+        return RedisDropboxEntry(*args, **kwargs)
+
+
+class RedisDropboxDownloadStream(AbstractRedisStream, RedisDropboxDownloadList):
+    """
+    A Redis stream which maps Dropbox files to download.
+    Note: Dropbox entries must be processed in order (a file can be added, deleted and added
+    again), so each bearertoken should be drained by a single consumer.
+    """
+    pass
+
+
+class RedisDropboxIndexStream(AbstractRedisStream, RedisDropboxIndexList):
+    """
+    A Redis stream which maps files to index with Solr.
+    Note: Dropbox entries must be processed in order (a file can be added, deleted and added
+    again), so each bearertoken should be drained by a single consumer.
+    """
+    pass
+
+
+RedisDropboxDownloadList.stream_cls = RedisDropboxDownloadStream
+RedisDropboxIndexList.stream_cls = RedisDropboxIndexStream
@@ -0,0 +1,70 @@
+import json
+from unittest import TestCase
+
+from utils.exceptions import InconsistentItemError
+from ..entry import ApiDropboxEntry, RedisDropboxEntry
+
+
+class RedisDropboxEntryTest(TestCase):
+
+    def test_legacy_hash_entry(self):
+        """
+        A entry stored in a hash before `rev` and `metadata_json` were added to `__all__` is
+        decoded with those fields empty.
+        """
+        entry_dict = {
+            b'remote_path': b'/Folder1/file1.txt',
+            b'local_name': b'file1.txt',
+            b'operation': b'+',
+        }
+        entry = RedisDropboxEntry(b'7777777xxx', entry_dict)  # The command under test.
+
+        self.assertEqual(entry.remote_path, '/Folder1/file1.txt')
+        self.assertEqual(entry.local_name, 'file1.txt')
+        self.assertTrue(entry.is_add())
+        self.assertEqual(entry.rev, '')
+        self.assertIsNone(entry.get_metadata())
+
+    def test_lazy_sanity_check(self):
+        """
+        The fields are decoded and checked only when the first of them is read.
+        """
+        entry = RedisDropboxEntry(b'7777777xxx', {b'remote_path': b'/file1.txt',
+                                                  b'operation': b'?'})
+
+        self.assertNotIn('operation', entry.__dict__)
+        with self.assertRaises(InconsistentItemError):
+            entry.remote_path  # The command under test.
+
+
+class ApiDropboxEntryTest(TestCase):
+
+    def test_stored_metadata(self):
+        """
+        Only the metadata needed to index the file are stored with the entry.
+        """
+        entry = ApiDropboxEntry([  # The command under test.
+            '/temp/moogletest/uno.txt',
+            {
+                'mime_type': 'text/plain',
+                'bytes': 205,
+                'thumb_exists': False,
+                'modified': 'Mon, 27 Jan 2014 21:09:36 +0000',
+                'size': '205 bytes',
+                'path': '/temp/MoogleTest/uno.txt',
+                'icon': 'page_white_text',
+                'client_mtime': 'Wed, 14 Mar 2012 00:02:51 +0000',
+                'root': 'dropbox',
+                'is_dir': False,
+                'revision': 241780,
+                'rev': '3b0740265d3a0'
+            }
+        ])
+
+        self.assertEqual(json.loads(entry.metadata_json), {
+            'path': '/temp/MoogleTest/uno.txt',
+            'rev': '3b0740265d3a0',
+            'mime_type': 'text/plain',
+            'bytes': 205,
+            'modified': 'Mon, 27 Jan 2014 21:09:36 +0000',
+        })
@@ -1,6 +1,7 @@
 from .crawler import DropboxCrawler
 from .downloader import DropboxDownloader
 from .indexer import DropboxIndexer
+from .redislist import RedisDropboxDownloadList, RedisDropboxIndexList
 from updater import AbstractUpdater
 
 
@@ -9,20 +10,23 @@ class DropboxUpdater(AbstractUpdater):
     Fetch updates from Dropbox for a `bearertoken`.
     """
     def run(self):
-        print(">>>>>> START CRAWLING")
+        self._run_stages(
+            ('CRAWLING', self._crawl, RedisDropboxDownloadList(self._bearertoken_id)),
+            ('DOWNLOADING', self._download, RedisDropboxIndexList(self._bearertoken_id)),
+            ('INDEXING', self._index, None),
+        )
+
+    def _crawl(self, end_of_stream):
         # `DropboxCrawler` receives a `BearerToken` argument because it needs to update
         # its cursor.
         DropboxCrawler(self.bearertoken).run()
-        print(">>>>>> END CRAWLING")
 
+    def _download(self, end_of_stream):
         # `DropboxDownloader` parameters are the bearertoken id and access_token. A proper
         # `BearerToken` instance is not required because no update is required.
         # Plus passing `self.bearertoken` would have resulted in an edited object in SQLAlchemy
         # session, because it was edited (and committed) by `DropboxCrawler`.
-        print("\n\n>>>>>> START DOWNLOADING")
-        DropboxDownloader(self._bearertoken_id, self._access_token).run()
-        print(">>>>>> END DOWNLOADING")
+        DropboxDownloader(self._bearertoken_id, self._access_token).run(end_of_stream)
 
-        print("\n\n>>>>>> START INDEXING")
-        DropboxIndexer(self._bearertoken_id, self._access_token).run()
-        print(">>>>>> END INDEXING")
\ No newline at end of file
+    def _index(self, end_of_stream):
+        DropboxIndexer(self._bearertoken_id, self._access_token).run(end_of_stream)
@@ -3,6 +3,8 @@ from requests_oauthlib import OAuth2Session
 
 from .response import ApiFacebookResponse
 from crawler import AbstractCrawler
+from models import Provider
+from utils.http import mount_http_adapters
 from magpie.settings import settings
 
 
@@ -16,16 +18,41 @@ class FacebookCrawler(AbstractCrawler):
     Parameters:
     bearertoken -- a `models.BearerToken`
     """
+    PROVIDER_NAME = Provider.NAME_FACEBOOK
+
     def _init_client(self):
-        return OAuth2Session(
+        # The per-token auth goes on top of the process-wide pools of connections.
+        return mount_http_adapters(OAuth2Session(
             client_id=self.bearertoken.provider.client_id,
             token=self.bearertoken.token_set
-        )
+        ))
 
     @staticmethod
     def _init_response(*args, **kwargs):
         return ApiFacebookResponse(*args, **kwargs)
 
+    def _is_rate_limited(self, r):
+        """
+        Facebook replies 400 with a specific error code when the rate limit is exceeded:
+        https://developers.facebook.com/docs/graph-api/advanced/rate-limiting
+        """
+        if r.status_code == 429:
+            return True
+        if r.status_code != 400:
+            return False
+        try:
+            code = r.json().get('error', {}).get('code')
+        except ValueError:
+            return False
+        # 4: app limit, 17: user limit, 32: page limit, 613: custom limit.
+        return code in (4, 17, 32, 613)
+
+    def _sign_request(self, resource_url):
+        """
+        Add the OAuth 2 bearer token, like `OAuth2Session` does.
+        """
+        return resource_url, {'Authorization': 'Bearer {}'.format(self.bearertoken.access_token)}
+
     def _build_resource_url(self, pagination_cursor):
         """
         Build the URL to use to query Facebook.
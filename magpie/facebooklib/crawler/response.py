@@ -31,7 +31,7 @@ class ApiFacebookResponse(AbstractApiResponse):
         if self.response.status_code != 200:
             msg = 'HTTP Status: {}\n{}'.format(self.response.status_code, self.response.json())
             raise FacebookResponseError(msg)
-        # TODO implement a check on rate limit error
+        # Rate limits are enforced by `AbstractCrawler` with `utils.ratelimit.RateLimiter`.
 
     def _init_redis_list(self, *args, **kwargs):
         return RedisFacebookList(*args, **kwargs)
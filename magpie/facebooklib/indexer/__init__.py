@@ -19,10 +19,16 @@ class FacebookIndexer:
         self.bearertoken_id = bearertoken_id
         self.access_token = access_token
 
-    def run(self):
+    def run(self, end_of_stream=None):
+        """
+        Send all the posts in Redis to Solr.
+
+        Parameters:
+        end_of_stream -- the id of the run when streaming, see `AbstractRedisList.iterate()`.
+        """
         redis = RedisFacebookList(self.bearertoken_id)
         solr_updater = FacebookSolrUpdater(self.bearertoken_id)
-        for redis_entry in redis.iterate():
+        for redis_entry in redis.iterate(end_of_stream):
             # `redis_entry` is a `RedisFacebookEntry` instance.
             log.debug('id={}\n'.format(redis_entry.id) +
                       'from_name={}\n'.format(redis_entry.from_name) +
@@ -34,4 +40,6 @@ class FacebookIndexer:
                       'message_clean={}\n'.format(redis_entry.message_clean)
             )
             solr_updater.add(redis_entry)
-        solr_updater.commit()
\ No newline at end of file
+        # The entries are going to be removed from Redis: they must be safely in Solr.
+        solr_updater.commit(durable=True)
+        redis.ack()
@@ -1,5 +1,5 @@
 from .entry import RedisFacebookEntry
-from redislist import AbstractRedisList
+from redislist import AbstractRedisList, AbstractRedisStream
 
 
 class RedisFacebookList(AbstractRedisList):
@@ -12,4 +12,14 @@ class RedisFacebookList(AbstractRedisList):
 
     @staticmethod
     def _init_redis_provider_entry(*args, **kwargs):
-        return RedisFacebookEntry(*args, **kwargs)
\ No newline at end of file
+        return RedisFacebookEntry(*args, **kwargs)
+
+
+class RedisFacebookStream(AbstractRedisStream, RedisFacebookList):
+    """
+    Stream (queue) of Facebook posts in Redis.
+    """
+    pass
+
+
+RedisFacebookList.stream_cls = RedisFacebookStream
@@ -1,5 +1,6 @@
 from .crawler import FacebookCrawler
 from .indexer import FacebookIndexer
+from .redislist import RedisFacebookList
 from updater import AbstractUpdater
 
 
@@ -8,12 +9,15 @@ class FacebookUpdater(AbstractUpdater):
     Fetch updates from Facebook for a `bearertoken`.
     """
     def run(self):
-        print(">>>>>> START CRAWLING")
+        self._run_stages(
+            ('CRAWLING', self._crawl, RedisFacebookList(self._bearertoken_id)),
+            ('INDEXING', self._index, None),
+        )
+
+    def _crawl(self, end_of_stream):
         # `FacebookCrawler` receives a `BearerToken` argument because it needs to update
         # its cursor.
         FacebookCrawler(self.bearertoken).run()
-        print(">>>>>> END CRAWLING")
 
-        print("\n\n>>>>>> START INDEXING")
-        FacebookIndexer(self._bearertoken_id, self._access_token).run()
-        print(">>>>>> END INDEXING")
+    def _index(self, end_of_stream):
+        FacebookIndexer(self._bearertoken_id, self._access_token).run(end_of_stream)
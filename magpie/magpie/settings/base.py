@@ -24,6 +24,69 @@ TEST_BEARERTOKEN_IDS = range(0, 51)  # From 0 to 50 included.
 DROPBOX_MAX_FILE_SIZE = 10*1024*1024  # 10 MB in bytes
 DROPBOX_TEMP_STORAGE_PATH = normpath(join(BASE_DIR, '_tmp', 'dropbox'))
 DROPBOX_FILE_EXT_FILTER = ['txt', 'doc', 'docx', 'pdf']  # lowercase!
+# Max number of partitions of a Dropbox account (see `models.DropboxPartition`) crawled at the
+# same time.
+DROPBOX_DELTA_WORKERS = 4
+# Stream the content of Dropbox files straight from Dropbox to Solr, with no temp file, when the
+# downloader runs beside the indexer (see `dropboxlib.downloader.DropboxDownloader`).
+DROPBOX_DIRECT_INDEXING = False
+# Files are downloaded and posted to Solr in chunks of this size, so they are never entirely in
+# memory.
+FILE_CHUNK_SIZE = 64*1024  # 64 KB.
+# Max number of files downloaded at the same time for a bearertoken, and in the whole process.
+DROPBOX_DOWNLOAD_WORKERS = 4
+DROPBOX_MAX_DOWNLOADS = 16
+# Retries of a download failed because Dropbox is unavailable or the connection failed, after
+# 1, 2, 4.. times this many seconds.
+DROPBOX_DOWNLOAD_MAX_RETRIES = 3
+DROPBOX_DOWNLOAD_RETRY_BACKOFF = 1
+# Seconds the content of a Dropbox file already extracted by Solr is remembered (by rev), so the
+# same content is not downloaded and extracted again, see `dropboxlib.contentindex`.
+DROPBOX_CONTENT_INDEX_TTL = 30*24*60*60  # 30 days.
+# Local on-disk LRU cache of the text extracted by Solr from Dropbox files (by rev), so a reindex
+# (f.i. after a reset) posts the text with no extraction. When enabled, files are extracted with
+# no indexing and then added as JSON docs, so the extracted text is got back.
+DROPBOX_TEXT_CACHE_PATH = normpath(join(BASE_DIR, '_tmp', 'dropbox_text'))
+# Size budget of the cache, 0 to disable it.
+DROPBOX_TEXT_CACHE_MAX_BYTES = 512*1024*1024  # 512 MB.
+# Max number of files posted to Solr (for text extraction) at the same time. 1 to post them one at
+# a time.
+DROPBOX_EXTRACT_WORKERS = 4
+
+# Update scheduler settings (see `scheduler.UpdateScheduler`).
+SCHEDULER_MAX_WORKERS = 16
+# Max number of concurrent updates per provider.
+SCHEDULER_PROVIDER_LIMITS = {
+    'twitter': 8,
+    'facebook': 8,
+    'dropbox': 4,
+}
+SCHEDULER_MIN_INTERVAL = 5*60  # Seconds between 2 updates of the same bearertoken.
+SCHEDULER_REFRESH_INTERVAL = 60  # Seconds between 2 reads of the bearertokens from the db.
+SCHEDULER_POLL_INTERVAL = 1  # Seconds.
+
+# Run the stages of an update (crawling, downloading, indexing) concurrently, so that entries are
+# indexed while the crawler is still fetching. See `updater.AbstractUpdater`.
+UPDATER_STREAMING = False
+
+# Async crawler settings (see `asynccrawler.AsyncCrawlerEngine`).
+ASYNC_CRAWLER_MAX_CONNECTIONS = 200  # Max number of requests in flight.
+ASYNC_CRAWLER_MAX_PER_HOST = 50  # Max number of requests in flight to the same host.
+# Max number of Dropbox crawls running at the same time (they are blocking, so each one takes a
+# thread of a pool of their own).
+ASYNC_CRAWLER_DROPBOX_WORKERS = 10
+
+# Rate limits per provider (see `utils.ratelimit`): max REQUESTS per bearertoken every WINDOW
+# seconds, in bursts of up to BURST requests.
+RATE_LIMITS = {
+    'twitter': {'REQUESTS': 180, 'WINDOW': 15*60, 'BURST': 15},
+    'facebook': {'REQUESTS': 600, 'WINDOW': 10*60, 'BURST': 20},
+    'dropbox': {'REQUESTS': 600, 'WINDOW': 60, 'BURST': 20},
+}
+# Retries of a request refused because the rate limit was exceeded anyway.
+RATE_LIMIT_MAX_RETRIES = 3
+# Seconds to wait after a refused request when the provider does not say (Retry-After header).
+RATE_LIMIT_DEFAULT_BACKOFF = 60
 
 # Redis connection.
 REDIS = {
@@ -31,6 +94,58 @@ REDIS = {
         'PATH': '/tmp/redis.sock',
     }
 }
+# Number of entries popped from a Redis list (and fetched from their hashes) in a single round
+# trip when iterating over it.
+REDIS_BATCH_SIZE = 500
+# Entries buffered in a Redis pipeline are flushed as soon as they are this many or this many bytes,
+# so the memory used while crawling does not depend on the size of API responses.
+REDIS_BUFFER_MAX_ENTRIES = 200
+REDIS_BUFFER_MAX_BYTES = 1024*1024  # 1 MB.
+# A flush slower than this (seconds) halves the max number of buffered entries (backpressure).
+REDIS_BUFFER_SLOW_FLUSH = 0.5
+# Reliable mode for Redis lists: popped entries are kept in Redis until they are acknowledged,
+# so that a crashed run can be resumed. See `redislist.AbstractRedisList`.
+REDIS_RELIABLE_QUEUE = True
+# Store each entry as a single packed item in the Redis list instead of a id plus a hash, to save
+# memory and keys. See `redislist.AbstractRedisList`.
+REDIS_PACKED_ENTRIES = True
+# Backend for the provider queues: 'list' (a single consumer per bearertoken) or 'stream' (Redis
+# streams with consumer groups, so several indexers can drain the same bearertoken in parallel).
+# Streams require Redis >= 5.0. See `redislist.AbstractRedisStream`.
+REDIS_QUEUE_BACKEND = 'list'
+# Seconds a consumer waits for new entries when streaming (see UPDATER_STREAMING).
+REDIS_STREAMING_POLL_INTERVAL = 0.5
+REDIS_STREAM_GROUP = 'magpie'
+# Pending stream entries idle for longer than this (milliseconds) are claimed by other consumers.
+REDIS_STREAM_CLAIM_IDLE = 10*60*1000  # 10 minutes.
+# Seconds the "producer done" key of a streaming run is kept, so that every consumer of the group
+# (and not only the one which reads the end-of-stream marker) knows when to stop.
+REDIS_STREAM_END_TTL = 24*60*60  # 1 day.
 
 # Solr connection.
-SOLR_URL = 'http://127.0.0.1:8983/solr'
\ No newline at end of file
+SOLR_URL = 'http://127.0.0.1:8983/solr'
+
+# Docs are sent to Solr in a single update as soon as they are this many or this many bytes (see
+# `solrupdater.AbstractSolrUpdater`).
+SOLR_BATCH_MAX_DOCS = 500
+SOLR_BATCH_MAX_BYTES = 2*1024*1024  # 2 MB.
+
+# Max number of Dropbox deletes sent to Solr in a single request.
+SOLR_DELETE_BATCH_SIZE = 200
+
+# Commit policy (see `utils.solr.Solr`): 'hard' commits always open a new searcher, while with
+# 'soft' updates become visible within SOLR_COMMIT_WITHIN milliseconds and durable commits do not
+# open a new searcher, so concurrent indexers do not thrash the cores.
+SOLR_COMMIT_POLICY = 'soft'
+SOLR_COMMIT_WITHIN = 5000  # 5 seconds.
+
+# Process-wide pools of keep-alive HTTP connections, by URL prefix (see `utils.http`). 'default' is
+# used for any other URL. POOLS is the number of hosts cached, MAXSIZE the number of connections
+# kept per host (it should be >= the number of threads using the host concurrently) and
+# MAX_RETRIES the retries on connection errors.
+HTTP_POOLS = {
+    'default': {'POOLS': 10, 'MAXSIZE': 10, 'MAX_RETRIES': 0},
+    'https://api.twitter.com': {'POOLS': 1, 'MAXSIZE': 20, 'MAX_RETRIES': 2},
+    'https://graph.facebook.com': {'POOLS': 1, 'MAXSIZE': 20, 'MAX_RETRIES': 2},
+    SOLR_URL: {'POOLS': 1, 'MAXSIZE': 20, 'MAX_RETRIES': 2},
+}
\ No newline at end of file
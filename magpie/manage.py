@@ -1,5 +1,6 @@
 import argparse
 
+from magpie.settings import settings
 from models import Provider
 from utils.solr import Solr, CORE_NAMES
 
@@ -126,9 +127,31 @@ def redis_flush(args):
 
 def redis_print(args):
     from utils.redis import open_redis_connection
+    from redis.exceptions import ResponseError
+    from redislist import PACKED_ENTRY_MAGIC, END_OF_STREAM_MAGIC
     redis = open_redis_connection()
 
-    if args.bearertoken_id:
+    if args.bearertoken_id and settings.REDIS_QUEUE_BACKEND == 'stream':
+        print("Printing Redis streams for bearertoken_id: {}.".format(args.bearertoken_id))
+        streams = redis.keys('*token:{}:stream'.format(args.bearertoken_id))
+        if not streams:
+            print("\n * NO STREAM")
+        for stream in streams:
+            print("\n * THE STREAM {} CONTAINS {} MESSAGES:".format(
+                stream, redis.execute_command('XLEN', stream)))
+            print(redis.execute_command('XRANGE', stream, '-', '+'))
+            # Messages read by a consumer and not acknowledged yet.
+            try:
+                pending = redis.execute_command('XPENDING', stream, settings.REDIS_STREAM_GROUP,
+                                                '-', '+', settings.REDIS_BATCH_SIZE)
+            except ResponseError:  # NOGROUP: the stream has never been read.
+                pending = []
+            print("\n * {} PENDING MESSAGES (id, consumer, idle ms, deliveries):".format(
+                len(pending)))
+            for message in pending:
+                print(message)
+
+    elif args.bearertoken_id:
         print("Printing Redis keys for bearertoken_id: {}.".format(args.bearertoken_id))
         lists = redis.keys('*token:{}'.format(args.bearertoken_id))
         if not lists:
@@ -140,8 +163,22 @@ def redis_print(args):
             sizel = len(items)
             print("\n * THE LIST {} CONTAINS {} ITEMS:".format(list, sizel))
             print(items)
+            # Packed entries and end-of-stream markers have no hash.
+            sizel -= len([item for item in items if item.startswith(PACKED_ENTRY_MAGIC) or
+                          item.startswith(END_OF_STREAM_MAGIC)])
+
+        # Lists of entries popped in reliable mode and not acknowledged yet.
+        processing_lists = redis.keys('*token:{}:processing'.format(args.bearertoken_id))
+        sizep = 0
+        for list in processing_lists:
+            items = redis.lrange(list, 0 , -1)
+            print("\n * THE PROCESSING LIST {} CONTAINS {} ITEMS:".format(list, len(items)))
+            print(items)
+            sizep += len([item for item in items if not item.startswith(PACKED_ENTRY_MAGIC) and
+                          not item.startswith(END_OF_STREAM_MAGIC)])
 
         hashes = redis.keys('*token:{}:*'.format(args.bearertoken_id))
+        hashes = [hash_ for hash_ in hashes if hash_ not in processing_lists]
         if not hashes:
             print("\n * NO HASHES")
         else:
@@ -154,10 +191,12 @@ def redis_print(args):
         size = len(lists)
         msg = 'OK' if size in [1, 0] else 'NOK!!!!!'
         print("{} list(s) found - {}".format(size, msg))
-        # Check that the size of the list is = the number of hashes like *token:x:*
+        # Check that the number of not packed items in the list (plus the processing list) is =
+        # the number of hashes like *token:x:*
         sizeh = len(hashes)
-        msg = 'OK' if sizel == sizeh else 'NOK!!!!!'
-        print("{} items in the list, {} hashes - {}".format(sizel, sizeh, msg))
+        msg = 'OK' if sizel + sizep == sizeh else 'NOK!!!!!'
+        print("{} not packed items in the list, {} in processing, {} hashes - {}".format(
+            sizel, sizep, sizeh, msg))
 
     if args.all:
         print(" * PRINTING ALL REDIS KEYS:")
@@ -181,12 +220,66 @@ def update(args):
         elif args.test_bearertoken_id == 'dropbox':
             bearertoken_id = '46'
     print("Fetching updates for bearertoken_id: {}".format(bearertoken_id))
-    updater = UpdateManager(bearertoken_id, args.reset_cursor)
+    updater = UpdateManager(bearertoken_id, args.reset_cursor, args.streaming or None)
     updater.run()
 
     print("Done.")
 
 
+def crawl(args):
+    from asynccrawler import AsyncCrawlerEngine
+
+    bearertoken_ids = args.bearertoken_id
+    if args.all:
+        from utils.db import session_autocommit
+        from models import BearerToken
+        with session_autocommit() as sex:
+            bearertoken_ids = [row.id for row in sex.query(BearerToken.id)]
+    print("Crawling {} bearertokens...".format(len(bearertoken_ids)))
+    errors = AsyncCrawlerEngine(bearertoken_ids, args.max_connections).run()
+    for bearertoken_id, error in errors.items():
+        print("Failed bearertoken_id: {}: {!r}".format(bearertoken_id, error))
+
+    print("Done.")
+
+
+def schedule(args):
+    from scheduler import UpdateScheduler
+
+    provider_limits = None
+    if args.provider_limit:
+        provider_limits = dict(settings.SCHEDULER_PROVIDER_LIMITS)
+        for provider_name, limit in args.provider_limit:
+            provider_limits[provider_name] = int(limit)
+    print("Scheduling updates for all bearertokens...")
+    scheduler = UpdateScheduler(args.workers, provider_limits, args.min_interval)
+    scheduler.run(once=args.once)
+
+    print("Done.")
+
+
+def dropbox_partition(args):
+    from utils.db import session_autocommit
+    from models import BearerToken, DropboxPartition
+    from dropboxlib.redislist import RedisDropboxDownloadList
+
+    print(" * Partitioning the Dropbox account of bearertoken_id: {}".format(
+        args.bearertoken_id))
+    with session_autocommit() as sex:
+        bearertoken = sex.query(BearerToken).filter_by(id=args.bearertoken_id).one()
+        for partition in bearertoken.dropbox_partitions:
+            sex.delete(partition)
+        for path_prefix in args.path_prefix:
+            sex.add(DropboxPartition(bearertoken=bearertoken, path_prefix=path_prefix))
+        # The account is crawled from scratch: new partitions have no cursor and the files
+        # outside them must be deleted from the index.
+        bearertoken.updates_cursor = None
+        redis = RedisDropboxDownloadList(args.bearertoken_id)
+        redis.buffer_add_reset()
+        redis.flush_buffer()
+    print("Done.")
+
+
 def ping(args):
     print('Ping... pong')
     print("Done.")
@@ -237,8 +330,36 @@ if __name__ == '__main__':
                         help='Use the test bearertoken_id for the given provider.')
     subcmd.add_argument('--reset-cursor', action='store_true',
                         help='Reset the cursor before updating.')
+    subcmd.add_argument('--streaming', action='store_true',
+                        help='Run crawling, downloading and indexing concurrently.')
     subcmd.set_defaults(func=update)
 
+    # `crawl` subcommand.
+    subcmd = subparsers.add_parser('crawl',
+                                   help='Crawl many bearertokens concurrently with asyncio.')
+    group = subcmd.add_mutually_exclusive_group(required=True)
+    group.add_argument('--bearertoken-id', type=int, action='append',
+                        help='A bearertoken_id to crawl, it can be repeated.')
+    group.add_argument('--all', action='store_true',
+                       help='All bearertokens.')
+    subcmd.add_argument('--max-connections', type=int,
+                        help='Max number of requests in flight.')
+    subcmd.set_defaults(func=crawl)
+
+    # `schedule` subcommand.
+    subcmd = subparsers.add_parser('schedule',
+                                   help='Fetch updates for all bearertokens concurrently.')
+    subcmd.add_argument('--workers', type=int,
+                        help='Max number of concurrent updates.')
+    subcmd.add_argument('--provider-limit', nargs=2, action='append',
+                        metavar=('PROVIDER', 'LIMIT'),
+                        help='Max number of concurrent updates for a provider.')
+    subcmd.add_argument('--min-interval', type=int,
+                        help='Min number of seconds between 2 updates of a bearertoken.')
+    subcmd.add_argument('--once', action='store_true',
+                        help='Update every bearertoken once, then exit.')
+    subcmd.set_defaults(func=schedule)
+
     # `solr` subcommand.
     subcmd = subparsers.add_parser('solr', help='Reset and print the content of Solr index.')
     sub_subparsers = subcmd.add_subparsers()
@@ -259,6 +380,19 @@ if __name__ == '__main__':
                        help='The provider (Solr core) to print.')
     sub_subcmd.set_defaults(func=solr_print)
 
+    # `dropbox` subcommand.
+    subcmd = subparsers.add_parser('dropbox', help='Dropbox specific operations.')
+    sub_subparsers = subcmd.add_subparsers()
+    # `dropbox partition` sub-subcommand.
+    sub_subcmd = sub_subparsers.add_parser(
+        'partition', help='Crawl a Dropbox account as many partitions, each with its own cursor.')
+    sub_subcmd.add_argument('--bearertoken_id', type=int, required=True,
+                            help='The bearertoken_id of the Dropbox account.')
+    sub_subcmd.add_argument('path_prefix', nargs='*',
+                            help='A folder to crawl as a partition, like: /Photos. '
+                                 'None to crawl the entire account as a whole.')
+    sub_subcmd.set_defaults(func=dropbox_partition)
+
     # `ping` subcommand -- just a mock.
     subcmd = subparsers.add_parser('ping', help='Prints pong.')
     subcmd.set_defaults(func=ping)
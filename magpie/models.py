@@ -192,5 +192,22 @@ class BearerToken(Base):
         return "<BearerToken(id={}, provider={})>".format(self.id, provider_name)
 
 
+class DropboxPartition(Base):
+    """
+    A partition of a Dropbox account: the files under `path_prefix`, crawled as a delta stream
+    with its own cursor (see `dropboxlib.crawler.DropboxCrawler`).
+    A account with no partitions is crawled as a whole, with `BearerToken.updates_cursor`.
+    """
+    __tablename__ = "crawlers.dropboxpartition"
 
+    id = Column(Integer, primary_key=True)
+    bearertoken_id = Column(Integer, ForeignKey('crawlers.bearertoken.id'), nullable=False)
+    bearertoken = relationship("BearerToken", backref=backref('dropbox_partitions'))
+    # A folder like: /Photos (Dropbox paths are case-insensitive).
+    path_prefix = Column(String(1024), nullable=False)
+    # The delta cursor of the partition, see `BearerToken.updates_cursor`.
+    updates_cursor = Column(String(512))
 
+    def __repr__(self):
+        return "<DropboxPartition(id={}, bearertoken_id={}, path_prefix={})>".format(
+            self.id, self.bearertoken_id, self.path_prefix)
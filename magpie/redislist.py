@@ -1,14 +1,142 @@
 from abc import ABCMeta, abstractmethod
+import os
+import socket
+import struct
+import time
 
+from redis.exceptions import ResponseError
+
+from magpie.settings import settings
 from utils.redis import open_redis_connection
 
 
+# Lua script to move up to ARGV[1] items from the head of the list KEYS[1] to the tail of the
+# list KEYS[2], preserving their order. It is the bulk version of LMOVE KEYS[1] KEYS[2] LEFT RIGHT
+# and it is atomic like any Lua script in Redis.
+LMOVE_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# Lua script to move all the items of the list KEYS[2] back to the head of the list KEYS[1],
+# preserving their order.
+RECLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[1], items[i])
+end
+redis.call('DEL', KEYS[2])
+return #items
+"""
+
+
+# A packed entry is a single bytes string holding all the fields of a entry (see `_pack_entry()`).
+# It starts with a NUL byte, which can never be the first char of a entry id, so packed entries
+# and ids of entries stored in hashes can live together in the same Redis list.
+PACKED_ENTRY_MAGIC = b'\x00'
+_FIELD_LENGTH = struct.Struct('>I')
+
+
+def _pack_entry(entry):
+    """
+    Pack all the fields of a entry in a compact bytes string like:
+        PACKED_ENTRY_MAGIC <length><id> <length><field 1> <length><field 2> ...
+    where the fields come in the same order as `entry.__all__` and each length is a 4-byte
+    unsigned integer.
+
+    Parameters:
+    entry -- A `Api<Provider>Entry` instance.
+    """
+    field_names = list(entry.__all__)
+    field_names.remove('id')
+    chunks = [PACKED_ENTRY_MAGIC]
+    for field_name in ['id'] + field_names:
+        # Values are formatted like Redis does when storing them in a hash.
+        value = '{}'.format(getattr(entry, field_name)).encode('UTF-8')
+        chunks.append(_FIELD_LENGTH.pack(len(value)))
+        chunks.append(value)
+    return b''.join(chunks)
+
+
+# A end-of-stream marker is pushed to a Redis list by the producer stage of a update running in
+# streaming mode when it ends, see `AbstractUpdater`. It is this magic byte followed by the id of
+# the run, so that a consumer stops only at the marker of its own run. Like packed entries, it can
+# never be mistaken for a entry id.
+END_OF_STREAM_MAGIC = b'\x01'
+
+
+def _build_end_of_stream_marker(run_id):
+    return END_OF_STREAM_MAGIC + '{}'.format(run_id).encode('UTF-8')
+
+
+def _unpack_entry(packed):
+    """
+    Unpack a bytes string built by `_pack_entry()`. Return a list of bytes strings: the id of
+    the entry followed by its fields.
+    """
+    values = []
+    offset = len(PACKED_ENTRY_MAGIC)
+    while offset < len(packed):
+        length, = _FIELD_LENGTH.unpack_from(packed, offset)
+        offset += _FIELD_LENGTH.size
+        values.append(packed[offset:offset + length])
+        offset += length
+    return values
+
+
+def _unpack_entry_id(packed):
+    """
+    Unpack only the id of a entry packed by `_pack_entry()`.
+    """
+    length, = _FIELD_LENGTH.unpack_from(packed, len(PACKED_ENTRY_MAGIC))
+    offset = len(PACKED_ENTRY_MAGIC) + _FIELD_LENGTH.size
+    return packed[offset:offset + length]
+
+
 class AbstractRedisList(metaclass=ABCMeta):
     """
     Abstract class to manage a single list (queue) in Redis.
+
+    In reliable mode the entries are not removed from Redis when they are popped: their ids are
+    moved to a processing list and their hashes are kept until `ack()` is called. If the
+    consumer dies before acknowledging, the next iteration reclaims those entries and delivers
+    them again. Reliable mode assumes a single consumer per list.
+    A consumer which moves the entries to another list acknowledges them in the same transaction
+    which pushes them to the other list, see `ack_on_flush()`.
+
+    Parameters:
+    bearertoken_id -- a `models.BearerToken.id`.
+    reliable -- True to use the reliable mode, default: settings.REDIS_RELIABLE_QUEUE.
     """
-    def __init__(self, bearertoken_id):
+    # The `AbstractRedisStream` subclass to use instead of this list when Redis streams are the
+    # configured backend. Set by concrete lists.
+    stream_cls = None
+
+    def __new__(cls, *args, **kwargs):
+        if settings.REDIS_QUEUE_BACKEND == 'stream' and cls.stream_cls:
+            cls = cls.stream_cls
+        return super().__new__(cls)
+
+    def __init__(self, bearertoken_id, reliable=None):
         self._list_name = self._build_list_name(bearertoken_id)
+        self._processing_list_name = '{}:processing'.format(self._list_name)
+        self._reliable = settings.REDIS_RELIABLE_QUEUE if reliable is None else reliable
+        # Items popped in reliable mode and not acknowledged yet, in the order they were
+        # popped: tuples of (name of the hash of the entry, None for packed entries and
+        # end-of-stream markers; True for entries, False for end-of-stream markers).
+        self._in_flight = []
+        # The list whose entries are acknowledged when this list is flushed, see
+        # `ack_on_flush()`.
+        self._ack_source = None
+        # Number of entries and bytes buffered in the pipeline and not flushed yet.
+        self._buffered_entries = 0
+        self._buffered_bytes = 0
+        # Auto-flush threshold by number of entries: it shrinks when Redis is slow to flush.
+        self._max_buffered_entries = settings.REDIS_BUFFER_MAX_ENTRIES
 
     @staticmethod
     @abstractmethod
@@ -45,6 +173,13 @@ class AbstractRedisList(metaclass=ABCMeta):
         # TODO
         print("Storing {} in Redis.".format(entry))
 
+        if settings.REDIS_PACKED_ENTRIES:
+            # A single item in the Redis list holds all the fields: no hash.
+            packed = _pack_entry(entry)
+            self._pipeline.rpush(self._list_name, packed)
+            self._auto_flush_buffer(len(packed))
+            return
+
         # Redis list to store all ids of entities
         self._pipeline.rpush(
             self._list_name,
@@ -60,60 +195,251 @@ class AbstractRedisList(metaclass=ABCMeta):
             hash_dict[field_name] = getattr(entry, field_name)
 
         self._pipeline.hmset(hash_name, hash_dict)
+        # Rough size of the commands: the fields of the hash (names and values) plus the id.
+        size = 2 * len(hash_name) + sum(len(str(k)) + len(str(v)) for k, v in hash_dict.items())
+        self._auto_flush_buffer(size)
+
+    def _auto_flush_buffer(self, size):
+        """
+        Account for a entry of `size` bytes just buffered in the pipeline and flush the pipeline
+        when it holds too many entries or bytes, so that the memory used by the buffer stays
+        bounded no matter how many entries a API response contains.
+
+        Parameters:
+        size -- approximate size in bytes of the buffered entry.
+        """
+        self._buffered_entries += 1
+        self._buffered_bytes += size
+        if (self._buffered_entries >= self._max_buffered_entries or
+                self._buffered_bytes >= settings.REDIS_BUFFER_MAX_BYTES):
+            self.flush_buffer()
 
     def flush_buffer(self):
         """
         Flush the pipeline (Redis' buffer) to Redis.
+
+        The flush is synchronous, so a slow Redis slows down the producer too (backpressure).
+        Moreover when a flush takes longer than settings.REDIS_BUFFER_SLOW_FLUSH seconds the
+        auto-flush threshold is halved, and it grows back when flushes are fast again.
         """
+        if self._ack_source is not None and self._buffered_entries:
+            # In the same MULTI/EXEC transaction: one entry of the source for each entry pushed.
+            self._ack_source._buffer_ack(self._pipeline, self._buffered_entries)
         if self._pipeline:
+            start = time.monotonic()
             self._pipeline.execute()
+            elapsed = time.monotonic() - start
+            if elapsed > settings.REDIS_BUFFER_SLOW_FLUSH:
+                self._max_buffered_entries = max(1, self._max_buffered_entries // 2)
+            else:
+                self._max_buffered_entries = min(settings.REDIS_BUFFER_MAX_ENTRIES,
+                                                 self._max_buffered_entries * 2)
+        self._buffered_entries = 0
+        self._buffered_bytes = 0
 
-    def iterate(self):
+    def push_end_of_stream(self, run_id):
+        """
+        Push the end-of-stream marker of the run `run_id` to this Redis list: the consumer
+        iterating with `end_of_stream=run_id` stops when it finds it.
+        Buffered entries are flushed first.
+        """
+        self.flush_buffer()
+        r = open_redis_connection()
+        r.rpush(self._list_name, _build_end_of_stream_marker(run_id))
+
+    def iterate(self, end_of_stream=None):
         """
         Iterate over the Redis list.
         Return an iterator object which iterates over `Redis<Provider>Entry` objects.
+        Entries are popped from Redis in batches (see `iterate_batches()`), but they are yielded
+        one at a time.
+
+        Parameters:
+        end_of_stream -- see `iterate_batches()`.
         """
+        for batch in self.iterate_batches(end_of_stream=end_of_stream):
+            for entry in batch:
+                yield entry
+
+    def iterate_batches(self, batch_size=None, end_of_stream=None):
+        """
+        Iterate over the Redis list in batches.
+        Return an iterator object which iterates over lists of `Redis<Provider>Entry` objects.
+
+        Each batch costs 2 round trips to Redis, no matter how many entries it contains: one to
+        pop the items and one to fetch (and, unless in reliable mode, delete) all their hashes.
+        The second one is skipped when all the items are packed entries.
+
+        Parameters:
+        batch_size -- max number of entries in each batch, default: settings.REDIS_BATCH_SIZE.
+        end_of_stream -- the id of a run (see `push_end_of_stream()`). If given, the iteration
+            does not stop when the list is empty, but it waits for new entries until the
+            end-of-stream marker of that run is popped. Otherwise the iteration stops when the
+            list is empty. End-of-stream markers of other runs are always skipped.
+        """
+        batch_size = batch_size or settings.REDIS_BATCH_SIZE
         r = open_redis_connection()
-        pipeline = r.pipeline()
+        marker = None
+        if end_of_stream is not None:
+            marker = _build_end_of_stream_marker(end_of_stream)
+        # Set when the end-of-stream marker has been popped.
+        is_ended = False
+
+        if self._reliable:
+            # Entries left in the processing list were popped by a previous run which died
+            # before acknowledging them.
+            self.reclaim()
+            lmove_batch = r.register_script(LMOVE_BATCH_SCRIPT)
 
-        def _lpop():
+        def _pop_items():
             """
-            Pop from the head of the Redis list and get the hash entry.
-            Convert the pop and hash items to a `Redis<Provider>Entry` instance.
+            Pop up to `batch_size` items from the head of the Redis list.
             """
-            entry_id = r.lpop(self._list_name)
-            if not entry_id:  # The list has been completely consumed.
-                return None
+            if self._reliable:
+                return lmove_batch(keys=[self._list_name, self._processing_list_name],
+                                   args=[batch_size])
+            # LRANGE + LTRIM is the bulk version of LPOP. They are sent in a MULTI/EXEC
+            # transaction so that nothing can be pushed or popped in between.
+            pipeline = r.pipeline(transaction=True)
+            pipeline.lrange(self._list_name, 0, batch_size - 1)
+            pipeline.ltrim(self._list_name, batch_size, -1)
+            items, _ = pipeline.execute()
+            return items
 
-            hash_name = '{}:{}'.format(self._list_name, entry_id.decode(encoding='UTF-8'))
-            entry_dict = r.hgetall(hash_name)
-            # Delete the hash through a pipeline. The use of a pipeline is to avoid a sort
-            # of bug. The bug was the following:
-            # entry = r.hgetall(hash_name)  -- READ
-            # r.delete(hash_name)           -- DELETE
-            # Sometimes the DELETE happens before the READ causing the read value to be None: this
-            # is very very weird, but it happened sometimes. Using a pipeline solve this.
-            pipeline.delete(hash_name)
-            return self._init_redis_provider_entry(entry_id, entry_dict)
-
-        def _lpop_mgr():
+        def _lpop_batch():
             """
-            Wrap _lpop in a try-except block to make sure the pipeline is executed even in case
-            of exception.
+            Pop up to `batch_size` items from the head of the Redis list and get the hashes of
+            those which are not packed entries.
+            Convert the popped items and hashes to a list of `Redis<Provider>Entry` instances.
             """
-            try:
-                item = _lpop()
-                if not item:
-                    pipeline.execute()
-                return item
-            except:
-                pipeline.execute()
-                raise
+            nonlocal is_ended
+            if is_ended:
+                return None
+            items = _pop_items()
+            while not items and marker:
+                # The producer is still running: wait for new entries.
+                time.sleep(settings.REDIS_STREAMING_POLL_INTERVAL)
+                items = _pop_items()
+            if not items:  # The list has been completely consumed.
+                return None
+
+            # Packed items hold the whole entry, while the other items are ids whose fields
+            # must be read from their hashes. End-of-stream markers are not entries.
+            entries = [None] * len(items)
+            hash_names = [None] * len(items)
+            for i, item in enumerate(items):
+                if item.startswith(END_OF_STREAM_MAGIC):
+                    # Items after the marker (if any) were pushed by a later run: they are
+                    # delivered anyway since they have already been popped.
+                    is_ended = is_ended or item == marker
+                elif item.startswith(PACKED_ENTRY_MAGIC):
+                    entries[i] = self._init_redis_provider_entry(_unpack_entry_id(item), item)
+                else:
+                    hash_names[i] = '{}:{}'.format(self._list_name, item.decode(encoding='UTF-8'))
+            hashes = [(i, hash_name) for i, hash_name in enumerate(hash_names) if hash_name]
+            if self._reliable:
+                self._in_flight.extend((hash_name, entry is not None or hash_name is not None)
+                                       for hash_name, entry in zip(hash_names, entries))
+            if not hashes:
+                return [entry for entry in entries if entry is not None]
+
+            pipeline = r.pipeline(transaction=True)
+            for _, hash_name in hashes:
+                pipeline.hgetall(hash_name)
+            if self._reliable:
+                # Hashes are deleted only when acknowledged.
+                entry_dicts = pipeline.execute()
+            else:
+                # Read and delete all the hashes in a single MULTI/EXEC transaction. The
+                # transaction also avoids a sort of bug. The bug was the following:
+                # entry = r.hgetall(hash_name)  -- READ
+                # r.delete(hash_name)           -- DELETE
+                # Sometimes the DELETE happens before the READ causing the read value to be None:
+                # this is very very weird, but it happened sometimes.
+                pipeline.delete(*[hash_name for _, hash_name in hashes])
+                entry_dicts = pipeline.execute()[:-1]  # The last result is the one of DELETE.
+
+            for (i, _), entry_dict in zip(hashes, entry_dicts):
+                entries[i] = self._init_redis_provider_entry(items[i], entry_dict)
+            return [entry for entry in entries if entry is not None]
 
-        # The first argument of iter must be a callable, that's why we created the _lpop()
+        # The first argument of iter must be a callable, that's why we created the _lpop_batch()
         # closure. This closure will be called for each iteration and the result is returned
         # until the result is None.
-        return iter(_lpop_mgr, None)
+        return iter(_lpop_batch, None)
+
+    def ack(self):
+        """
+        Acknowledge all the entries popped so far in reliable mode: remove their ids from the
+        processing list and delete their hashes.
+        Call it only when the entries have been safely processed, f.i. after a Solr commit.
+        """
+        if not self._in_flight:
+            return
+
+        r = open_redis_connection()
+        pipeline = r.pipeline(transaction=True)
+        self._buffer_ack(pipeline)
+        pipeline.execute()
+
+    def ack_on_flush(self, source):
+        """
+        Acknowledge the entries popped from the list `source` in the same MULTI/EXEC transaction
+        which flushes the entries buffered in this list: one entry of `source` (in the order
+        they were popped) for each entry buffered. Use it when the entries of `source` are
+        moved to this list, so a entry is never in both lists: if the process dies after a flush
+        its entries are not delivered again by `source`.
+
+        Parameters:
+        source -- a `AbstractRedisList`.
+        """
+        self._ack_source = source
+
+    def _buffer_ack(self, pipeline, count=None):
+        """
+        Acknowledge (through `pipeline`) the first `count` entries popped and not acknowledged
+        yet, or all of them if `count` is None.
+        """
+        hash_names = self._take_in_flight(count)
+        if not hash_names:
+            return
+        # Entries are acknowledged in the same order they were popped, so they are exactly the
+        # ones at the head of the processing list.
+        pipeline.ltrim(self._processing_list_name, len(hash_names), -1)
+        # Packed entries and end-of-stream markers have no hash.
+        hash_names = [hash_name for hash_name in hash_names if hash_name]
+        for i in range(0, len(hash_names), settings.REDIS_BATCH_SIZE):
+            pipeline.delete(*hash_names[i:i + settings.REDIS_BATCH_SIZE])
+
+    def _take_in_flight(self, count=None):
+        """
+        Remove the first items popped and not acknowledged yet, up to the `count`-th entry
+        (end-of-stream markers are not entries, but the ones before it are removed too), or all
+        of them if `count` is None. Return their names (see `_in_flight`).
+        """
+        if count is None:
+            items, self._in_flight = self._in_flight, []
+        else:
+            n = 0
+            for _, is_entry in self._in_flight:
+                if is_entry:
+                    if not count:
+                        break
+                    count -= 1
+                n += 1
+            items, self._in_flight = self._in_flight[:n], self._in_flight[n:]
+        return [name for name, _ in items]
+
+    def reclaim(self):
+        """
+        Move all the entries which are in the processing list (so popped but not acknowledged)
+        back to the head of the Redis list, so they will be delivered again.
+        Return the number of reclaimed entries.
+        """
+        r = open_redis_connection()
+        reclaim = r.register_script(RECLAIM_SCRIPT)
+        self._in_flight = []
+        return reclaim(keys=[self._list_name, self._processing_list_name])
 
     @staticmethod
     @abstractmethod
@@ -121,9 +447,196 @@ class AbstractRedisList(metaclass=ABCMeta):
         pass
 
 
+class AbstractRedisStream(AbstractRedisList):
+    """
+    Abstract class to manage a single stream (queue) in Redis, read through a consumer group.
+
+    It is a drop-in replacement for `AbstractRedisList`: several processes can drain the same
+    stream in parallel, each of them as a different consumer of the group, and every entry is
+    delivered at least once. Entries are read with XREADGROUP and stay pending until `ack()` is
+    called. Pending entries idle for more than settings.REDIS_STREAM_CLAIM_IDLE milliseconds
+    (because their consumer died) are claimed and delivered again.
+    Note: the order of the entries is preserved only with a single consumer.
+
+    Entries are always packed (see `_pack_entry()`) in the field `e` of the stream message.
+
+    Concrete streams are built by mixing this class with a concrete list, like:
+        class RedisTwitterStream(AbstractRedisStream, RedisTwitterList):
+            pass
+    """
+    def __init__(self, bearertoken_id, reliable=None):
+        super().__init__(bearertoken_id, reliable)
+        # A different name than the list, so lists and streams never clash.
+        self._list_name = '{}:stream'.format(self._list_name)
+        self._group_name = settings.REDIS_STREAM_GROUP
+        self._consumer_name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        # Messages read and not acknowledged yet, in the order they were read: tuples of
+        # (message id, True for entries and False for end-of-stream markers).
+        self._in_flight = []
+
+    def buffer(self, entry):
+        """
+        Add a entry to this Redis stream (through a pipeline, which is a buffer).
+
+        Parameters:
+        entry -- A `Api<Provider>Entry` instance to be added.
+        """
+        packed = _pack_entry(entry)
+        self._pipeline.execute_command('XADD', self._list_name, '*', 'e', packed)
+        self._auto_flush_buffer(len(packed))
+
+    def push_end_of_stream(self, run_id):
+        """
+        Add the end-of-stream marker of the run `run_id` to this Redis stream.
+        Buffered entries are flushed first.
+        The marker is read by a single consumer of the group, so a "producer done" key is set
+        too: the other consumers stop when they find no new messages after it is set.
+        """
+        self.flush_buffer()
+        r = open_redis_connection()
+        pipeline = r.pipeline(transaction=True)
+        pipeline.execute_command('XADD', self._list_name, '*', 'e',
+                                 _build_end_of_stream_marker(run_id))
+        pipeline.setex(self._build_ended_key_name(run_id), settings.REDIS_STREAM_END_TTL, 1)
+        pipeline.execute()
+
+    def _build_ended_key_name(self, run_id):
+        return '{}:ended:{}'.format(self._list_name, run_id)
+
+    def iterate_batches(self, batch_size=None, end_of_stream=None):
+        """
+        Iterate over the Redis stream in batches.
+        Return an iterator object which iterates over lists of `Redis<Provider>Entry` objects.
+        The stale pending entries of dead consumers are delivered first.
+
+        Parameters:
+        batch_size -- max number of entries in each batch, default: settings.REDIS_BATCH_SIZE.
+        end_of_stream -- see `AbstractRedisList.iterate_batches()`.
+        """
+        batch_size = batch_size or settings.REDIS_BATCH_SIZE
+        r = open_redis_connection()
+        self._create_group(r)
+        claimed = self._claim_stale(r, batch_size)
+        marker = None
+        if end_of_stream is not None:
+            marker = _build_end_of_stream_marker(end_of_stream)
+        # Set when the end-of-stream marker has been read.
+        is_ended = False
+        # Set when the producer has pushed its end-of-stream marker (possibly read by another
+        # consumer of the group): the messages not read yet are the last ones.
+        is_producer_done = False
+
+        def _read_messages():
+            """
+            Read up to `batch_size` new messages for this consumer.
+            """
+            args = ['XREADGROUP', 'GROUP', self._group_name, self._consumer_name,
+                    'COUNT', batch_size]
+            if marker and not is_producer_done:
+                # Waiting for a end-of-stream marker: block until new messages arrive.
+                args += ['BLOCK', int(settings.REDIS_STREAMING_POLL_INTERVAL * 1000)]
+            args += ['STREAMS', self._list_name, '>']
+            reply = r.execute_command(*args)
+            # `reply` is like: [[b'twitter:token:1:stream', [[b'1400000000000-0', [b'e',
+            # b'...']], ...]]], or None when there are no new messages.
+            return reply[0][1] if reply else []
+
+        def _read_batch():
+            """
+            Read up to `batch_size` messages for this consumer.
+            Convert them to a list of `Redis<Provider>Entry` instances.
+            """
+            nonlocal is_ended, is_producer_done
+            if is_ended:
+                return None
+            if claimed:
+                messages = claimed.pop(0)
+            else:
+                messages = _read_messages()
+                while not messages and marker and not is_producer_done:
+                    # The producer is still running: wait for new messages. The key is set after
+                    # the last message was added, so a read following it gets all the rest.
+                    is_producer_done = r.exists(self._build_ended_key_name(end_of_stream))
+                    messages = _read_messages()
+            if not messages:  # The stream has been completely consumed.
+                return None
+
+            entries = []
+            for message_id, fields in messages:
+                packed = dict(zip(fields[::2], fields[1::2]))[b'e']
+                self._in_flight.append((message_id, not packed.startswith(END_OF_STREAM_MAGIC)))
+                if packed.startswith(END_OF_STREAM_MAGIC):
+                    is_ended = is_ended or packed == marker
+                    continue
+                entries.append(self._init_redis_provider_entry(_unpack_entry_id(packed), packed))
+            return entries
+
+        # The first argument of iter must be a callable, that's why we created the _read_batch()
+        # closure. This closure will be called for each iteration and the result is returned
+        # until the result is None.
+        return iter(_read_batch, None)
+
+    def _create_group(self, r):
+        """
+        Create the consumer group (and the stream) if it does not exist yet.
+        """
+        try:
+            r.execute_command('XGROUP', 'CREATE', self._list_name, self._group_name, '0',
+                              'MKSTREAM')
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _claim_stale(self, r, batch_size):
+        """
+        Claim the pending messages idle for more than settings.REDIS_STREAM_CLAIM_IDLE
+        milliseconds. Return a list of batches of messages.
+        """
+        min_idle = settings.REDIS_STREAM_CLAIM_IDLE
+        batches = []
+        start = '-'
+        while True:
+            # Each pending message is like: [b'1400000000000-0', b'host:1234', 83120, 1], that is:
+            # message id, consumer name, idle time in milliseconds, number of deliveries.
+            pending = r.execute_command('XPENDING', self._list_name, self._group_name, start, '+',
+                                        batch_size)
+            stale_ids = [message_id for message_id, _, idle, _ in pending if idle >= min_idle]
+            if stale_ids:
+                messages = r.execute_command('XCLAIM', self._list_name, self._group_name,
+                                             self._consumer_name, min_idle, *stale_ids)
+                # Messages deleted in the meantime are claimed as None.
+                messages = [message for message in messages if message and message[1]]
+                if messages:
+                    batches.append(messages)
+            if len(pending) < batch_size:
+                return batches
+            # Start right after the last pending message.
+            last_ms, last_seq = pending[-1][0].decode('UTF-8').split('-')
+            start = '{}-{}'.format(last_ms, int(last_seq) + 1)
+
+    def _buffer_ack(self, pipeline, count=None):
+        """
+        Acknowledge (through `pipeline`) the first `count` messages read and not acknowledged
+        yet, or all of them if `count` is None, and delete them from the stream.
+        """
+        message_ids = self._take_in_flight(count)
+        for i in range(0, len(message_ids), settings.REDIS_BATCH_SIZE):
+            chunk = message_ids[i:i + settings.REDIS_BATCH_SIZE]
+            pipeline.execute_command('XACK', self._list_name, self._group_name, *chunk)
+            pipeline.execute_command('XDEL', self._list_name, *chunk)
+
+    def reclaim(self):
+        """
+        Stale pending messages are claimed when iterating, see `_claim_stale()`.
+        """
+        return 0
+
+
 class AbstractRedisEntry(metaclass=ABCMeta):
     """
     A entry (Facebook post, Twitter tweet, Dropbox file, ...) stored in Redis.
+    Its fields are decoded lazily, the first time one of them is read, and the sanity check is
+    run then.
 
     Parameters:
     entry_id -- a string, the id of the entry.
@@ -136,18 +649,45 @@ class AbstractRedisEntry(metaclass=ABCMeta):
             b'updated_time': '2014-05-01T16:59:41+0000',
             b'message': 'test message'
         }
+        or a packed entry (see `_pack_entry()`).
     """
     __all__ = ['id',]
 
     def __init__(self, entry_id, entry_dict):
         self.id = entry_id.decode(encoding='UTF-8')
+        self._entry_dict = entry_dict
 
+    def __getattr__(self, name):
+        """
+        Decode all the fields and run the sanity check the first time one of them is read.
+        Note: `__getattr__` is called only when the attribute has not been found in the usual
+        places, so only until the fields are decoded.
+        """
+        if name.startswith('_') or name not in self.__all__:
+            raise AttributeError(name)
+        self._decode_fields()
+        self._sanity_check()
+        return self.__dict__[name]
+
+    def _decode_fields(self):
         field_names = list(self.__all__)
         field_names.remove('id')
-        for field_name in field_names:
-            setattr(self, field_name, entry_dict[field_name.encode()].decode('UTF-8'))
 
-        self._sanity_check()
+        if isinstance(self._entry_dict, bytes):  # A packed entry.
+            # Fields appended to `__all__` after the entry was packed are empty.
+            values = _unpack_entry(self._entry_dict)[1:]
+            values += [b''] * (len(field_names) - len(values))
+            entry_dict = dict(zip([field_name.encode() for field_name in field_names], values))
+        else:
+            entry_dict = self._entry_dict
+
+        for field_name in field_names:
+            # Fields already set (f.i. by the consumer of the entry) are not overwritten.
+            # Fields added to `__all__` after the entry was stored in a hash are empty, like
+            # for packed entries.
+            if field_name not in self.__dict__:
+                setattr(self, field_name,
+                        entry_dict.get(field_name.encode(), b'').decode('UTF-8'))
 
     def _sanity_check(self):
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,175 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import time
+
+from magpie.settings import settings
+from utils.db import session_autocommit
+from models import BearerToken, Provider
+from updater import UpdateManager
+
+
+log = logging.getLogger('scheduler')
+
+
+class UpdateScheduler:
+    """
+    Run the updates of all the bearertokens in the db concurrently, in a long-running loop.
+
+    Updates run in a pool of worker threads. Each provider has its own queue of bearertokens and
+    its own concurrency limit, and free workers are given to providers in a round-robin fashion:
+    so a huge Dropbox account can only keep busy a Dropbox slot, while the Twitter accounts keep
+    flowing through the Twitter slots.
+    A bearertoken is never updated by 2 workers at the same time and it is updated again only
+    after `min_interval` seconds since its previous update ended.
+
+    Parameters:
+    max_workers -- size of the pool of workers, default: settings.SCHEDULER_MAX_WORKERS.
+    provider_limits -- dict like {Provider.NAME_DROPBOX: 2}, max number of concurrent updates
+        per provider, default: settings.SCHEDULER_PROVIDER_LIMITS.
+    min_interval -- min number of seconds between 2 updates of the same bearertoken, default:
+        settings.SCHEDULER_MIN_INTERVAL.
+    """
+    def __init__(self, max_workers=None, provider_limits=None, min_interval=None):
+        self.max_workers = max_workers or settings.SCHEDULER_MAX_WORKERS
+        self.provider_limits = provider_limits or settings.SCHEDULER_PROVIDER_LIMITS
+        self.min_interval = (settings.SCHEDULER_MIN_INTERVAL if min_interval is None
+                             else min_interval)
+
+        # Only the providers which have an updater.
+        self._provider_names = [name for name in Provider.NAME_CHOICES
+                                if name in UpdateManager.updaters_class_names]
+        # Per provider queue of bearertoken ids waiting for their turn.
+        self._queues = {name: deque() for name in self._provider_names}
+        # Number of running updates per provider.
+        self._running = {name: 0 for name in self._provider_names}
+        # Bearertoken ids which are currently being updated.
+        self._running_ids = set()
+        # Provider name of each known bearertoken id.
+        self._bearertokens = {}
+        # Time when the last update of each bearertoken id ended.
+        self._last_run = {}
+        # Bearertoken ids (and their provider names) of the updates just ended: filled by the
+        # workers, consumed by the scheduling loop which is the only owner of the state above.
+        self._done = queue.Queue()
+        # Index of the provider which gets the next free worker.
+        self._next_provider = 0
+        self._last_refresh = None
+
+    def run(self, once=False):
+        """
+        Schedule updates forever.
+
+        Parameters:
+        once -- if True, update every bearertoken only once and then return.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._refresh_bearertokens()
+            while True:
+                if not once and (time.monotonic() - self._last_refresh >
+                                 settings.SCHEDULER_REFRESH_INTERVAL):
+                    self._refresh_bearertokens()
+                self._submit_due(executor)
+
+                if once and not self._running_ids and not any(self._queues.values()):
+                    return
+
+                # Wait for an update to end, or for a bearertoken to become due.
+                try:
+                    bearertoken_id, provider_name = self._done.get(
+                        timeout=settings.SCHEDULER_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                self._mark_done(bearertoken_id, provider_name, requeue=not once)
+                # Drain all the updates ended in the meantime.
+                while True:
+                    try:
+                        bearertoken_id, provider_name = self._done.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._mark_done(bearertoken_id, provider_name, requeue=not once)
+
+    def _refresh_bearertokens(self):
+        """
+        Read all the bearertokens from the db: queue the new ones and forget the deleted ones.
+        """
+        with session_autocommit() as sex:
+            rows = sex.query(BearerToken.id, Provider.name).join(BearerToken.provider).filter(
+                Provider.name.in_(self._provider_names)).all()
+        bearertokens = dict(rows)
+
+        for bearertoken_id, provider_name in bearertokens.items():
+            if bearertoken_id not in self._bearertokens:
+                # New bearertokens have never been updated, so they go first.
+                self._queues[provider_name].appendleft(bearertoken_id)
+        for bearertoken_id, provider_name in self._bearertokens.items():
+            if bearertoken_id not in bearertokens:
+                try:
+                    self._queues[provider_name].remove(bearertoken_id)
+                except ValueError:  # It is running now: it will not be queued again.
+                    pass
+        self._bearertokens = bearertokens
+        self._last_refresh = time.monotonic()
+        log.debug("{} bearertokens to schedule.".format(len(self._bearertokens)))
+
+    def _submit_due(self, executor):
+        """
+        Give the free workers to the bearertokens which are due, one provider at a time in a
+        round-robin fashion.
+        """
+        while len(self._running_ids) < self.max_workers:
+            for i in range(len(self._provider_names)):
+                index = (self._next_provider + i) % len(self._provider_names)
+                provider_name = self._provider_names[index]
+                bearertoken_id = self._pop_due(provider_name)
+                if bearertoken_id is not None:
+                    break
+            else:  # No provider has a due bearertoken and a free slot.
+                return
+
+            self._next_provider = (index + 1) % len(self._provider_names)
+            self._running[provider_name] += 1
+            self._running_ids.add(bearertoken_id)
+            executor.submit(self._update, bearertoken_id, provider_name)
+
+    def _pop_due(self, provider_name):
+        """
+        Pop the first bearertoken id of the queue of `provider_name` which is due.
+        Return None if the provider has reached its concurrency limit or no bearertoken is due.
+        """
+        limit = self.provider_limits.get(provider_name, self.max_workers)
+        if self._running[provider_name] >= limit:
+            return None
+
+        now = time.monotonic()
+        q = self._queues[provider_name]
+        # Bearertokens are queued in the order they ended their last update, so only the first
+        # one must be checked.
+        if q and now - self._last_run.get(q[0], float('-inf')) >= self.min_interval:
+            return q.popleft()
+        return None
+
+    def _mark_done(self, bearertoken_id, provider_name, requeue):
+        """
+        Release the slot of a ended update and queue its bearertoken again.
+        """
+        self._running[provider_name] -= 1
+        self._running_ids.discard(bearertoken_id)
+        self._last_run[bearertoken_id] = time.monotonic()
+        if requeue and bearertoken_id in self._bearertokens:
+            self._queues[provider_name].append(bearertoken_id)
+
+    def _update(self, bearertoken_id, provider_name):
+        """
+        Run the update of a bearertoken. It runs in a worker thread.
+        """
+        try:
+            log.info("Updating bearertoken_id: {} ({}).".format(bearertoken_id, provider_name))
+            UpdateManager(bearertoken_id).run()
+        except Exception:
+            # A failing bearertoken must not stop the scheduler: it will be retried at its next
+            # turn.
+            log.exception("Update failed for bearertoken_id: {}.".format(bearertoken_id))
+        finally:
+            self._done.put((bearertoken_id, provider_name))
@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
+import json
 
+from magpie.settings import settings
 from utils.solr import Solr
 
 
@@ -8,21 +10,51 @@ class AbstractSolrUpdater(metaclass=ABCMeta):
     Receive an item like a Twitter tweet, a Facebook post, a Dropbox file, etc., convert it to
     a document and send it to Solr.
 
+    Documents are buffered and sent to Solr in a single JSON update as soon as they are
+    settings.SOLR_BATCH_MAX_DOCS or settings.SOLR_BATCH_MAX_BYTES bytes. The buffer is flushed
+    by `commit()` too.
+
     Parameters:
     bearertoken_id -- a `models.BearerToken.id`.
     """
     def __init__(self, bearertoken_id):
         self.bearertoken_id = bearertoken_id
         self.solr = Solr(self.CORE_NAME)
+        # Docs not sent to Solr yet, serialized to JSON and encoded to UTF-8 bytes, and their
+        # total size.
+        self._buffer = []
+        self._buffer_bytes = 0
 
     def add(self, redis_entry, commit=False):
         doc = self._convert_redis_entry_to_solr_doc(redis_entry)
 
-        self.solr.update([doc], 'json', commit)
-
-    def commit(self):
-        self.solr.commit()
+        # Serialized only once: the same bytes are sized here and posted by `flush()`.
+        body = json.dumps(doc).encode('utf-8')
+        self._buffer.append(body)
+        self._buffer_bytes += len(body)
+        if (len(self._buffer) >= settings.SOLR_BATCH_MAX_DOCS or
+                self._buffer_bytes >= settings.SOLR_BATCH_MAX_BYTES):
+            self.flush()
+
+        if commit:
+            self.commit()
+
+    def flush(self):
+        """
+        Send all the buffered docs to Solr, in a single update.
+        """
+        if self._buffer:
+            self.solr.update(b'[' + b','.join(self._buffer) + b']', 'json', False)
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def commit(self, durable=False):
+        """
+        Flush the buffer and commit, see `utils.solr.Solr.commit()`.
+        """
+        self.flush()
+        self.solr.commit(durable)
 
     @abstractmethod
     def _convert_redis_entry_to_solr_doc(self, redis_entry):
-        pass
\ No newline at end of file
+        pass
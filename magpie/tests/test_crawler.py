@@ -0,0 +1,28 @@
+from email.utils import formatdate
+import time
+from unittest import TestCase
+from unittest.mock import Mock
+
+from crawler import AbstractCrawler
+
+
+class RetryAfterTest(TestCase):
+
+    def build_response(self, **headers):
+        r = Mock()
+        r.headers = headers
+        return r
+
+    def test_delta_seconds(self):
+        r = self.build_response(**{'retry-after': '120'})
+        self.assertEqual(AbstractCrawler._get_retry_after(r), 120.0)  # The command under test.
+
+    def test_http_date(self):
+        r = self.build_response(**{'retry-after': formatdate(time.time() + 120, usegmt=True)})
+        retry_after = AbstractCrawler._get_retry_after(r)  # The command under test.
+
+        self.assertAlmostEqual(retry_after, 120, delta=2)
+
+    def test_invalid(self):
+        r = self.build_response(**{'retry-after': 'soon'})
+        self.assertIsNone(AbstractCrawler._get_retry_after(r))  # The command under test.
@@ -0,0 +1,168 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from redislist import (AbstractRedisList, AbstractRedisStream, AbstractRedisEntry, _pack_entry, _unpack_entry,
+                       _unpack_entry_id, PACKED_ENTRY_MAGIC)
+
+
+###################################################################################################
+# NOTE: unit test must not depend on external resources like Redis
+# We must use mocks here!
+###################################################################################################
+
+
+class RedisTestEntry(AbstractRedisEntry):
+    __all__ = ['id', 'text', 'lang', 'author']
+
+
+class RedisTestList(AbstractRedisList):
+    @staticmethod
+    def _build_list_name(bearertoken_id):
+        return 'test:token:{}'.format(bearertoken_id)
+
+    @staticmethod
+    def _init_redis_provider_entry(*args, **kwargs):
+        return RedisTestEntry(*args, **kwargs)
+
+
+class RedisTestStream(AbstractRedisStream, RedisTestList):
+    pass
+
+
+class RedisListTest(TestCase):
+
+    def setUp(self):
+        self.bearertoken_id = '7777777xxx'
+        self.list_name = 'test:token:{}'.format(self.bearertoken_id)
+        # A Redis connection whose pipelines return, at each `execute()`, the next result of
+        # `self.results`.
+        self.results = []
+        self.pipeline = Mock()
+        self.pipeline.execute.side_effect = lambda: self.results.pop(0)
+        self.redis = Mock()
+        self.redis.pipeline.return_value = self.pipeline
+        patcher = patch('redislist.open_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_iterate_batches(self):
+        """
+        A batch of ids is popped and all their hashes are read (and deleted) in 2 round trips.
+        """
+        self.results = [
+            # LRANGE + LTRIM.
+            ([b'1', b'2'], True),
+            # HGETALL, HGETALL, DEL.
+            ([{b'text': b'hello', b'lang': b'en', b'author': b'alice'},
+              {b'text': b'ciao', b'lang': b'it', b'author': b'bob'},
+              2]),
+            # LRANGE + LTRIM: the list is empty.
+            ([], True),
+        ]
+        redis = RedisTestList(self.bearertoken_id, reliable=False)
+        batches = list(redis.iterate_batches(batch_size=10))  # The command under test.
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([(entry.id, entry.text, entry.author) for entry in batches[0]],
+                         [('1', 'hello', 'alice'), ('2', 'ciao', 'bob')])
+        self.pipeline.lrange.assert_called_with(self.list_name, 0, 9)
+        self.pipeline.ltrim.assert_called_with(self.list_name, 10, -1)
+        self.pipeline.delete.assert_called_once_with('{}:1'.format(self.list_name),
+                                                     '{}:2'.format(self.list_name))
+        self.assertEqual(self.pipeline.execute.call_count, 3)
+
+    def test_ack_on_flush(self):
+        """
+        The entries moved from a list to another are acknowledged in the same transaction which
+        pushes them, together with the end-of-stream markers popped before them.
+        """
+        source = RedisTestList('source', reliable=True)
+        source._in_flight = [('test:token:source:1', True), (None, False),
+                             ('test:token:source:2', True), ('test:token:source:3', True)]
+        redis = RedisTestList(self.bearertoken_id, reliable=True)
+        redis.ack_on_flush(source)
+        for entry_id in (b'1', b'2'):
+            entry = RedisTestEntry(entry_id, {b'text': b'', b'lang': b'', b'author': b''})
+            redis.buffer(entry)
+        self.results = [[]]
+        redis.flush_buffer()  # The command under test.
+
+        self.pipeline.ltrim.assert_called_once_with('test:token:source:processing', 3, -1)
+        self.pipeline.delete.assert_called_once_with('test:token:source:1',
+                                                     'test:token:source:2')
+        self.assertEqual(self.pipeline.execute.call_count, 1)
+        self.assertEqual(source._in_flight, [('test:token:source:3', True)])
+
+    def test_stream_producer_done(self):
+        """
+        A consumer of a stream whose end-of-stream marker was read by another consumer stops
+        once the producer is done and no new messages are left.
+        """
+        packed = _pack_entry(RedisTestEntry(b'1', {b'text': b'hello', b'lang': b'en',
+                                                   b'author': b''}))
+        replies = {
+            'XREADGROUP': [None, [[b'test:token:1:stream', [[b'1-0', [b'e', packed]]]]], None],
+            'XPENDING': [[]],
+        }
+        self.redis.execute_command.side_effect = lambda command, *args: (
+            replies[command].pop(0) if command in replies else b'OK')
+        self.redis.exists.return_value = True
+        redis = RedisTestStream('1')
+        batches = list(redis.iterate_batches(end_of_stream='run1'))  # The command under test.
+
+        self.assertEqual([[entry.text for entry in batch] for batch in batches], [['hello']])
+        self.redis.exists.assert_called_once_with('test:token:1:stream:ended:run1')
+        # Only the first read blocks: the producer was already done at the second one.
+        reads = [call[0] for call in self.redis.execute_command.call_args_list
+                 if call[0][0] == 'XREADGROUP']
+        self.assertEqual(['BLOCK' in read for read in reads], [True, False, False])
+
+
+class PackedEntryTest(TestCase):
+
+    def build_entry(self, **fields):
+        entry = Mock()
+        entry.__all__ = RedisTestEntry.__all__
+        entry.id = '7777777xxx'
+        entry.text = 'città'
+        entry.lang = 'it'
+        entry.author = ''
+        for name, value in fields.items():
+            setattr(entry, name, value)
+        return entry
+
+    def test_pack_unpack(self):
+        """
+        A packed entry is unpacked to its id followed by its fields, in the order of `__all__`.
+        """
+        packed = _pack_entry(self.build_entry())  # The command under test.
+
+        self.assertTrue(packed.startswith(PACKED_ENTRY_MAGIC))
+        self.assertEqual(_unpack_entry(packed), [b'7777777xxx', 'città'.encode(), b'it', b''])
+        self.assertEqual(_unpack_entry_id(packed), b'7777777xxx')
+
+    def test_decode_packed_entry(self):
+        """
+        A packed entry is decoded to a `Redis<Provider>Entry`.
+        """
+        packed = _pack_entry(self.build_entry(author='alice'))
+        entry = RedisTestEntry(_unpack_entry_id(packed), packed)  # The command under test.
+
+        self.assertEqual(entry.id, '7777777xxx')
+        self.assertEqual(entry.text, 'città')
+        self.assertEqual(entry.lang, 'it')
+        self.assertEqual(entry.author, 'alice')
+
+    def test_decode_legacy_packed_entry(self):
+        """
+        A entry packed before some fields were appended to `__all__` is decoded with those
+        fields empty.
+        """
+        entry = self.build_entry()
+        entry.__all__ = ['id', 'text']
+        packed = _pack_entry(entry)
+        entry = RedisTestEntry(_unpack_entry_id(packed), packed)  # The command under test.
+
+        self.assertEqual(entry.text, 'città')
+        self.assertEqual(entry.lang, '')
+        self.assertEqual(entry.author, '')
@@ -1,8 +1,11 @@
 import logging
+from oauthlib.oauth1 import Client
 from requests_oauthlib import OAuth1Session
 
 from .response import ApiTwitterResponse
 from crawler import AbstractCrawler
+from models import Provider
+from utils.http import mount_http_adapters
 from magpie.settings import settings
 
 
@@ -16,18 +19,34 @@ class TwitterCrawler(AbstractCrawler):
     Parameters:
     bearertoken -- a `models.BearerToken`
     """
+    PROVIDER_NAME = Provider.NAME_TWITTER
+
     def _init_client(self):
-        return OAuth1Session(
+        # The per-token auth goes on top of the process-wide pools of connections.
+        return mount_http_adapters(OAuth1Session(
             client_key=self.bearertoken.provider.client_id,
             client_secret=self.bearertoken.provider.client_secret,
             resource_owner_key=self.bearertoken.oauth_token,
             resource_owner_secret=self.bearertoken.oauth_token_secret
-        )
+        ))
 
     @staticmethod
     def _init_response(*args, **kwargs):
         return ApiTwitterResponse(*args, **kwargs)
 
+    def _sign_request(self, resource_url):
+        """
+        Sign the request with OAuth 1.0a, like `OAuth1Session` does.
+        """
+        client = Client(
+            client_key=self.bearertoken.provider.client_id,
+            client_secret=self.bearertoken.provider.client_secret,
+            resource_owner_key=self.bearertoken.oauth_token,
+            resource_owner_secret=self.bearertoken.oauth_token_secret
+        )
+        url, headers, _ = client.sign(resource_url)
+        return url, headers
+
     def _build_resource_url(self, pagination_cursor):
         """
         Build the URL to use to query Twitter.
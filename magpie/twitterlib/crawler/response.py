@@ -29,8 +29,9 @@ class ApiTwitterResponse(AbstractApiResponse):
         if self.response.status_code != 200:
             msg = 'HTTP Status: {}\n{}'.format(self.response.status_code, self.response.json())
             raise TwitterResponseError(msg)
-        # TODO implement a check on rate limit error (max 180 GET requests per access_token
-        # TODO every 15 min): https://dev.twitter.com/docs/rate-limiting/1.1/limits
+        # Rate limits (max 180 GET requests per access_token every 15 min) are enforced by
+        # `AbstractCrawler` with `utils.ratelimit.RateLimiter`:
+        # https://dev.twitter.com/docs/rate-limiting/1.1/limits
 
     def _init_redis_list(self, *args, **kwargs):
         return RedisTwitterList(*args, **kwargs)
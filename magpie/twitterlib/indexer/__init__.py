@@ -19,10 +19,16 @@ class TwitterIndexer:
         self.bearertoken_id = bearertoken_id
         self.access_token = access_token
 
-    def run(self):
+    def run(self, end_of_stream=None):
+        """
+        Send all the tweets in Redis to Solr.
+
+        Parameters:
+        end_of_stream -- the id of the run when streaming, see `AbstractRedisList.iterate()`.
+        """
         redis = RedisTwitterList(self.bearertoken_id)
         solr_updater = TwitterSolrUpdater(self.bearertoken_id)
-        for redis_entry in redis.iterate():
+        for redis_entry in redis.iterate(end_of_stream):
             # `redis_entry` is a `RedisTwitterEntry` instance.
             log.debug('Read a tweet from Redis:\n' +
                       'id={}\n'.format(redis_entry.id) +
@@ -33,4 +39,6 @@ class TwitterIndexer:
                       'text_clean={}\n'.format(redis_entry.text_clean)
             )
             solr_updater.add(redis_entry)
-        solr_updater.commit()
\ No newline at end of file
+        # The entries are going to be removed from Redis: they must be safely in Solr.
+        solr_updater.commit(durable=True)
+        redis.ack()
@@ -1,5 +1,5 @@
 from .entry import RedisTwitterEntry
-from redislist import AbstractRedisList
+from redislist import AbstractRedisList, AbstractRedisStream
 
 
 class RedisTwitterList(AbstractRedisList):
@@ -12,4 +12,14 @@ class RedisTwitterList(AbstractRedisList):
 
     @staticmethod
     def _init_redis_provider_entry(*args, **kwargs):
-        return RedisTwitterEntry(*args, **kwargs)
\ No newline at end of file
+        return RedisTwitterEntry(*args, **kwargs)
+
+
+class RedisTwitterStream(AbstractRedisStream, RedisTwitterList):
+    """
+    Stream (queue) of Twitter tweets in Redis.
+    """
+    pass
+
+
+RedisTwitterList.stream_cls = RedisTwitterStream
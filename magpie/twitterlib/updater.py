@@ -1,5 +1,6 @@
 from .crawler import TwitterCrawler
 from .indexer import TwitterIndexer
+from .redislist import RedisTwitterList
 from updater import AbstractUpdater
 
 
@@ -8,12 +9,15 @@ class TwitterUpdater(AbstractUpdater):
     Fetch updates from Twitter for a `bearertoken`.
     """
     def run(self):
-        print(">>>>>> START CRAWLING")
-        # `DropboxCrawler` receives a `BearerToken` argument because it needs to update
+        self._run_stages(
+            ('CRAWLING', self._crawl, RedisTwitterList(self._bearertoken_id)),
+            ('INDEXING', self._index, None),
+        )
+
+    def _crawl(self, end_of_stream):
+        # `TwitterCrawler` receives a `BearerToken` argument because it needs to update
         # its cursor.
         TwitterCrawler(self.bearertoken).run()
-        print(">>>>>> END CRAWLING")
 
-        print("\n\n>>>>>> START INDEXING")
-        TwitterIndexer(self._bearertoken_id, self._access_token).run()
-        print(">>>>>> END INDEXING")
+    def _index(self, end_of_stream):
+        TwitterIndexer(self._bearertoken_id, self._access_token).run(end_of_stream)
@@ -1,5 +1,8 @@
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 
+from magpie.settings import settings
 from utils.db import session_autocommit
 from models import BearerToken, Provider
 
@@ -8,11 +11,21 @@ class AbstractUpdater(metaclass=ABCMeta):
     """
     Fetch updates from a Provider for a `bearertoken`.
 
+    An update is made of stages (crawling, downloading, indexing) connected by Redis lists.
+    By default a stage starts when the previous one is over. In streaming mode all the stages run
+    at the same time, each in its own thread: a stage consumes the entries of its Redis list
+    while the previous stage is still producing them, until it pops the end-of-stream marker
+    which the previous stage pushes when it ends (see `AbstractRedisList.push_end_of_stream()`).
+    With the stream backend the consumers of a group which do not read the marker stop when the
+    previous stage is done and no entries are left (see `AbstractRedisStream`).
+
     Parameters:
     bearertoken -- a `BearerToken` owner of the owner of the Dropbox account to synchronize with.
+    streaming -- True to run in streaming mode, default: settings.UPDATER_STREAMING.
     """
-    def __init__(self, bearertoken):
+    def __init__(self, bearertoken, streaming=None):
         self.bearertoken = bearertoken
+        self.streaming = settings.UPDATER_STREAMING if streaming is None else streaming
         with session_autocommit() as sex:
             # Add bearertoken to the current session.
             bearertoken = sex.merge(self.bearertoken)
@@ -23,6 +36,45 @@ class AbstractUpdater(metaclass=ABCMeta):
     def run(self):
         pass
 
+    def _run_stages(self, *stages):
+        """
+        Run the stages of the update.
+
+        Parameters:
+        stages -- tuples like (name, function, redis list) where:
+            function -- runs the stage, it receives the id of the run to pass to
+                `AbstractRedisList.iterate()` as `end_of_stream` (None when not streaming or
+                for the first stage).
+            redis list -- the `AbstractRedisList` the stage writes to, None for the last stage.
+        """
+        if not self.streaming:
+            for name, function, _ in stages:
+                print("\n\n>>>>>> START {}".format(name))
+                function(None)
+                print(">>>>>> END {}".format(name))
+            return
+
+        run_id = uuid.uuid4().hex
+
+        def _run_stage(name, function, redis, end_of_stream):
+            print("\n\n>>>>>> START {} (streaming)".format(name))
+            try:
+                function(end_of_stream)
+            finally:
+                # Even when the stage fails, so the next stage does not wait forever.
+                if redis:
+                    redis.push_end_of_stream(run_id)
+            print(">>>>>> END {} (streaming)".format(name))
+
+        with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+            futures = []
+            for i, (name, function, redis) in enumerate(stages):
+                end_of_stream = run_id if i > 0 else None
+                futures.append(executor.submit(_run_stage, name, function, redis, end_of_stream))
+        # Raise the first exception of the stages, if any.
+        for future in futures:
+            future.result()
+
 
 class UpdateManager:
     """
@@ -42,14 +94,18 @@ class UpdateManager:
         Provider.NAME_DROPBOX: DropboxUpdater,
     }
 
-    def __init__(self, bearertoken_id, reset_cursor=False):
+    def __init__(self, bearertoken_id, reset_cursor=False, streaming=None):
+        self.streaming = streaming
         with session_autocommit() as sex:
             self.bearertoken = sex.query(BearerToken).filter_by(id=bearertoken_id).one()
             self.provider_name = self.bearertoken.provider.name
             if reset_cursor:
                 self.bearertoken.updates_cursor = None
+                # The cursors of the partitions of a Dropbox account.
+                for partition in self.bearertoken.dropbox_partitions:
+                    partition.updates_cursor = None
 
     @abstractmethod
     def run(self):
-        updater = self.updaters_class_names[self.provider_name](self.bearertoken)
+        updater = self.updaters_class_names[self.provider_name](self.bearertoken, self.streaming)
         updater.run()
\ No newline at end of file
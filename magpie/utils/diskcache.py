@@ -0,0 +1,140 @@
+import hashlib
+import os
+from os.path import join, normpath, exists
+import tempfile
+import threading
+import zlib
+
+
+# Process-wide caches, by path.
+caches = {}
+_lock = threading.Lock()
+
+
+def open_disk_cache(path, max_bytes):
+    """
+    Generic function to call in order to use a on-disk cache. It returns the process-wide
+    `DiskLRUCache` stored in the folder `path`, so all the threads of the process share its size
+    accounting.
+    Use it like this:
+        cache = open_disk_cache(path, 512*1024*1024)
+        cache.set('key', b'value')
+    """
+    with _lock:
+        try:
+            return caches[path]
+        except KeyError:
+            cache = caches[path] = DiskLRUCache(path, max_bytes)
+            return cache
+
+
+class DiskLRUCache:
+    """
+    A key-value cache stored in a local folder, one (zlib compressed) file per key.
+    When the files exceed `max_bytes` in total, the least recently used ones are evicted: every
+    hit touches the modification time of its file, so the oldest files are the least recently
+    used ones.
+    Files are written atomically (to a temp file, then renamed), so many processes can share the
+    folder; each process keeps its own (approximate) accounting of the size of the folder.
+
+    Parameters:
+    path -- the folder of the cache, created if missing.
+    max_bytes -- the size budget of the cache in bytes, 0 to disable the cache.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = normpath(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def get(self, key):
+        """
+        Return the value (bytes) stored for `key`, or None.
+        """
+        if not self.max_bytes:
+            return None
+        file_path = self._build_file_path(key)
+        try:
+            with open(file_path, 'rb') as fin:
+                data = fin.read()
+            os.utime(file_path)  # Mark it as recently used.
+        except OSError:  # A miss, or evicted in the meantime.
+            return None
+        return zlib.decompress(data)
+
+    def has(self, key):
+        """
+        True if a value is stored for `key`.
+        """
+        return bool(self.max_bytes) and exists(self._build_file_path(key))
+
+    def set(self, key, value):
+        """
+        Store `value` (bytes) for `key`, evicting the least recently used values if needed.
+        """
+        if not self.max_bytes:
+            return
+        data = zlib.compress(value)
+        if len(data) > self.max_bytes:
+            return
+        if not exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        file_path = self._build_file_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(data)
+        with self._lock:
+            size = self._get_size()
+            try:
+                size -= os.path.getsize(file_path)  # Replaced.
+            except OSError:
+                pass
+            os.replace(tmp_path, file_path)
+            self._size = size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _build_file_path(self, key):
+        return join(self.path, hashlib.sha1(key.encode('UTF-8')).hexdigest())
+
+    def _get_size(self):
+        """
+        Return the size of the files of the cache, read from the disk the first time.
+        """
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        return self._size
+
+    def _scan(self):
+        """
+        Return a list of (file path, size, modification time) of the files of the cache.
+        """
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                try:
+                    stat = entry.stat()
+                except OSError:  # Evicted in the meantime.
+                    continue
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _evict(self):
+        """
+        Delete the least recently used files, until the cache is 90% of its budget (so the
+        folder is not scanned again at the next `set()`).
+        The size is read again from the disk, since other processes share the folder.
+        """
+        files = sorted(self._scan(), key=lambda f: f[2])
+        size = sum(f[1] for f in files)
+        target = self.max_bytes * 0.9
+        for file_path, file_size, _ in files:
+            if size <= target:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            size -= file_size
+        self._size = size
@@ -18,6 +18,14 @@ class ResponseError(Exception):
     pass
 
 
+class RateLimitError(ResponseError):
+    """A request was refused because the rate limit of the provider was exceeded."""
+    def __init__(self, msg='', retry_after=None):
+        super().__init__(msg)
+        # Seconds to wait before trying again, None if unknown.
+        self.retry_after = retry_after
+
+
 class TwitterResponseError(ResponseError):
     """An error response was received from Twitter."""
     pass
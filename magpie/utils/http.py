@@ -0,0 +1,76 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from magpie.settings import settings
+
+
+# Process-wide connection pools (`HTTPAdapter`s), by URL prefix and whether they retry.
+adapters = {}
+# Process-wide sessions, for requests which need no per-token auth (like Solr), by whether they
+# retry.
+sessions = {}
+_lock = threading.RLock()
+
+
+def get_http_adapter(prefix, retries=True):
+    """
+    Return the process-wide `requests.adapters.HTTPAdapter` for the URL `prefix` (like
+    'https://api.twitter.com'), built according to settings.HTTP_POOLS.
+    A adapter holds a pool of keep-alive connections and it is thread-safe, so all the
+    sessions of the process share it and reuse warm connections (no new TCP and TLS handshakes).
+
+    Parameters:
+    prefix -- the URL prefix.
+    retries -- False for a adapter which never retries, f.i. to send a body which can be read
+        only once.
+    """
+    with _lock:
+        try:
+            return adapters[(prefix, retries)]
+        except KeyError:
+            conf = settings.HTTP_POOLS.get(prefix, settings.HTTP_POOLS['default'])
+            adapter = adapters[(prefix, retries)] = HTTPAdapter(
+                pool_connections=conf['POOLS'],
+                pool_maxsize=conf['MAXSIZE'],
+                max_retries=conf['MAX_RETRIES'] if retries else 0,
+            )
+            return adapter
+
+
+def mount_http_adapters(s, retries=True):
+    """
+    Mount the process-wide adapters on the session `s`, f.i. a `OAuth1Session` which adds the
+    per-token auth on top of them. Return `s`.
+    Note: never close `s`, because closing a session closes its adapters.
+
+    Parameters:
+    s -- a `requests.Session`.
+    retries -- see `get_http_adapter()`.
+    """
+    for prefix in settings.HTTP_POOLS:
+        if prefix != 'default':
+            s.mount(prefix, get_http_adapter(prefix, retries))
+    # Any other URL.
+    s.mount('https://', get_http_adapter('default', retries))
+    s.mount('http://', get_http_adapter('default', retries))
+    return s
+
+
+def open_http_session(retries=True):
+    """
+    Generic function to call in order to send HTTP requests which need no per-token auth. It
+    returns a unique `requests.Session` which uses the process-wide adapters.
+    Use it like this:
+        r = open_http_session().post(url, data=data)
+
+    Parameters:
+    retries -- see `get_http_adapter()`.
+    """
+    with _lock:
+        try:
+            return sessions[retries]
+        except KeyError:
+            session = sessions[retries] = mount_http_adapters(requests.Session(), retries)
+            return session
@@ -0,0 +1,140 @@
+import time
+
+from magpie.settings import settings
+from .redis import open_redis_connection
+
+
+# Lua script implementing a token bucket stored in the hash KEYS[1].
+# ARGV: capacity (max burst), refill rate (tokens per second), current time (seconds).
+# It takes a token and returns 0 if a request can be sent now, otherwise it returns the number
+# of seconds to wait (as a string, since Lua numbers are truncated to integers by Redis).
+ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+local blocked_until = tonumber(bucket[3]) or 0
+if now < blocked_until then
+    return tostring(blocked_until - now)
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Lua script to sync the token bucket KEYS[1] with the quota declared by the provider.
+# ARGV: capacity, current time, requests remaining, time when the quota is reset (seconds).
+SYNC_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local remaining = tonumber(ARGV[3])
+local reset = tonumber(ARGV[4])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or capacity
+-- The provider knows better: never have more tokens than the requests it still accepts.
+if remaining < tokens then
+    redis.call('HMSET', KEYS[1], 'tokens', remaining, 'ts', now)
+end
+if remaining < 1 and reset > now then
+    redis.call('HSET', KEYS[1], 'blocked_until', reset)
+    redis.call('EXPIRE', KEYS[1], math.ceil(reset - now) + 60)
+end
+return 0
+"""
+
+# Lua script to stop all the requests of the token bucket KEYS[1] until ARGV[1] (seconds).
+# ARGV[2] is the current time. A longer block already in place (f.i. until the quota is reset,
+# see SYNC_SCRIPT) is never shortened.
+BLOCK_SCRIPT = """
+local now = tonumber(ARGV[2])
+local blocked_until = math.max(tonumber(ARGV[1]),
+                               tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0)
+redis.call('HMSET', KEYS[1], 'tokens', 0, 'ts', now, 'blocked_until', blocked_until)
+redis.call('EXPIRE', KEYS[1], math.ceil(blocked_until - now) + 60)
+return 0
+"""
+
+
+class RateLimiter:
+    """
+    Rate limiter for the requests sent to a provider on behalf of a bearertoken.
+
+    It is a token bucket stored in Redis, so all the processes crawling the same bearertoken
+    share it. The bucket is refilled at the rate allowed by the provider (see
+    settings.RATE_LIMITS) and it is synced with the quota declared by the provider in the
+    `x-rate-limit-remaining` and `x-rate-limit-reset` headers of its responses (Twitter), so
+    requests are paced to use all the quota without exceeding it.
+    Providers without a entry in settings.RATE_LIMITS are not limited.
+
+    Parameters:
+    provider_name -- a `models.Provider.name`.
+    bearertoken_id -- a `models.BearerToken.id`.
+    """
+    def __init__(self, provider_name, bearertoken_id):
+        self.key = 'ratelimit:{}:token:{}'.format(provider_name, bearertoken_id)
+        self.conf = settings.RATE_LIMITS.get(provider_name)
+        if self.conf:
+            self.capacity = self.conf['BURST']
+            self.rate = self.conf['REQUESTS'] / self.conf['WINDOW']
+
+    def try_acquire(self):
+        """
+        Take a token if a request can be sent now and return 0. Otherwise return the number of
+        seconds to wait before trying again.
+        """
+        if not self.conf:
+            return 0
+        r = open_redis_connection()
+        acquire = r.register_script(ACQUIRE_SCRIPT)
+        return float(acquire(keys=[self.key], args=[self.capacity, self.rate, time.time()]))
+
+    def acquire(self):
+        """
+        Block until a request can be sent.
+        """
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    def update_from_headers(self, headers):
+        """
+        Sync the bucket with the quota declared by the provider in the headers of a response.
+
+        Parameters:
+        headers -- the headers of a response, a case-insensitive dictionary.
+        """
+        if not self.conf or not headers:
+            return
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        if remaining is None or reset is None:
+            return
+        r = open_redis_connection()
+        sync = r.register_script(SYNC_SCRIPT)
+        sync(keys=[self.key], args=[self.capacity, time.time(), int(remaining), int(reset)])
+
+    def block(self, retry_after=None):
+        """
+        Stop all the requests for `retry_after` seconds, default:
+        settings.RATE_LIMIT_DEFAULT_BACKOFF, or longer if they are already blocked for longer.
+        Call it when the provider refused a request because the rate limit was exceeded anyway.
+        """
+        if retry_after is None:
+            retry_after = settings.RATE_LIMIT_DEFAULT_BACKOFF
+        if not self.conf:
+            # No bucket to block: just wait.
+            time.sleep(float(retry_after))
+            return
+        now = time.time()
+        r = open_redis_connection()
+        block = r.register_script(BLOCK_SCRIPT)
+        block(keys=[self.key], args=[now + float(retry_after), now])
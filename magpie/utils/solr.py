@@ -1,10 +1,15 @@
-from os.path import splitext, basename
+from os.path import splitext, basename, getsize
+import json
+import threading
+import time
+import uuid
+from xml.sax.saxutils import escape
 from mysolr import Solr as MySolr
 from mysolr.response import SolrResponse
-import requests
 
 from magpie.settings import settings
 from .exceptions import SolrResponseError
+from .http import open_http_session
 from models import Provider
 
 
@@ -27,18 +32,121 @@ def escape_solr_query(query):
     return query
 
 
+# Commits are coalesced per core, across all the `Solr` instances of the process: for each
+# core URL and kind of commit ('soft' or 'hard') a lock to serialize commits and the time when the
+# last successful commit started.
+_commits = {}
+_commits_lock = threading.Lock()
+
+
+def _get_commit_state(url, kind):
+    """
+    Return the state of the commits of the kind `kind` for the core `url`, a dictionary like:
+        {'lock': <threading.Lock>,
+         'started_at': <time.monotonic() when the last successful commit started>}
+    """
+    with _commits_lock:
+        try:
+            return _commits[(url, kind)]
+        except KeyError:
+            state = _commits[(url, kind)] = {'lock': threading.Lock(),
+                                             'started_at': float('-inf')}
+            return state
+
+
+class MultipartFileBody:
+    """
+    A multipart/form-data body holding a single file, to be posted with `requests` as `data`.
+    The file is read in chunks of `chunk_size` bytes while the body is being sent, so it is never
+    loaded entirely in memory (like `requests` does with `files`). Its length is known in
+    advance, so it is not sent with chunked transfer encoding.
+
+    Parameters:
+    field_name -- the name of the form field.
+    file_name -- the name of the file in the form.
+    file_path -- the local path of the file.
+    chunk_size -- size of the chunks, default: settings.FILE_CHUNK_SIZE.
+    """
+    def __init__(self, field_name, file_name, file_path, chunk_size=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size or settings.FILE_CHUNK_SIZE
+        boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(boundary)
+        self._head = ('--{}\r\n'.format(boundary) +
+                      'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'.format(
+                          field_name, file_name) +
+                      'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        self._tail = '\r\n--{}--\r\n'.format(boundary).encode('utf-8')
+
+    def __len__(self):
+        return len(self._head) + self._get_file_length() + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        # The file is closed even if the body is not sent entirely.
+        with self._open_file() as fin:
+            for chunk in iter(lambda: fin.read(self.chunk_size), b''):
+                yield chunk
+        yield self._tail
+
+    def _open_file(self):
+        return open(self.file_path, 'rb')
+
+    def _get_file_length(self):
+        return getsize(self.file_path)
+
+
+class MultipartStreamBody(MultipartFileBody):
+    """
+    Like `MultipartFileBody`, but the file is read from a stream (like the response of a
+    download) instead of a local file. It can be sent only once.
+
+    Parameters:
+    field_name -- the name of the form field.
+    file_name -- the name of the file in the form.
+    stream -- a file-like object with a `read(size)` method, it is closed when sent.
+    length -- the length of the content of `stream`, in bytes.
+    chunk_size -- size of the chunks, default: settings.FILE_CHUNK_SIZE.
+    """
+    def __init__(self, field_name, file_name, stream, length, chunk_size=None):
+        super().__init__(field_name, file_name, None, chunk_size)
+        self.stream = stream
+        self.length = length
+
+    def _open_file(self):
+        return self.stream
+
+    def _get_file_length(self):
+        return self.length
+
+
 class Solr:
     """
     A wrapper around `mysolr` library.
     It adds features missing in `mysolr`, like delete by query or add file.
+    All the updates are sent through the process-wide HTTP session (see `utils.http`), so they
+    reuse warm keep-alive connections to Solr.
+
+    Commits follow settings.SOLR_COMMIT_POLICY:
+      'hard' -- every commit is a hard commit which also opens a new searcher.
+      'soft' -- updates are sent with commitWithin=settings.SOLR_COMMIT_WITHIN, so they become
+        visible within that time with no commit at all. `commit()` is a soft commit (visible,
+        not durable) and `commit(durable=True)` is a hard commit which does not open a new
+        searcher (durable, cheap).
+    With both policies a commit is skipped when a successful commit of the same kind on the same
+    core started after the last update sent by this instance, since it already includes them: so
+    concurrent indexers of many bearertokens share their commits.
     """
     def __init__(self, core_name):
         self.url = '{}/{}'.format(settings.SOLR_URL, core_name)
+        # When the last update was completed.
+        self._last_update_at = float('-inf')
 
     @property
     def _mysolr(self):
         # TODO: This thing of caching mysolr will be useless with mysolr 0.9, because it has the
-        # TODO: ability to re-use the same requests.session, like:
+        # TODO: ability to re-use the same requests.session (so `search` could use the
+        # TODO: process-wide session of `utils.http`, like updates do), like:
         # TODO: session = requests.Session()
         # TODO: solr = Solr('http://localhost:8983/solr/collection1', make_request=session)
         # TODO: see http://mysolr.redtuna.org/en/latest/user/userguide.html
@@ -48,13 +156,30 @@ class Solr:
             self._mysolr_cache = MySolr(self.url, version=4)
             return self._mysolr_cache
 
-    def update(self, *args, **kwargs):
+    def update(self, documents, input_type='json', commit=True):
         """
-        Add/update a doc in Solr.
-        It uses mysolr library.
+        Add/update docs in Solr.
+        It has the same signature of `mysolr.Solr.update`, but it uses the process-wide HTTP
+        session because mysolr opens a new connection for each request.
+
+        Parameters:
+        documents -- a list of docs (dictionaries) to be added, or the same list already
+            serialized to JSON and encoded to UTF-8 bytes.
+        input_type -- only 'json' is supported.
+        commit -- True to commit right after the update.
         """
-        r = self._mysolr.update(*args, **kwargs)
-        self._sanity_check(r, True)
+        if input_type != 'json':
+            raise ValueError("Only 'json' input_type is supported.")
+        if not isinstance(documents, bytes):
+            documents = json.dumps(documents).encode('utf-8')
+        params = self._build_update_params()
+        headers = {'Content-type': 'application/json; charset=utf-8'}
+        r = open_http_session().post('{}/update'.format(self.url), params=params,
+                                     data=documents, headers=headers)
+        self._sanity_check(SolrResponse(r), True)
+        self._last_update_at = time.monotonic()
+        if commit:
+            self.commit()
 
     def search(self, *args, **kwargs):
         """
@@ -65,6 +190,26 @@ class Solr:
         self._sanity_check(r, True)
         return r
 
+    def get_docs(self, ids, fields=None):
+        """
+        Get docs by id with the real-time get handler of Solr, so docs added but not committed
+        yet are returned too.
+        Return a list of docs (dictionaries), only the ones found.
+
+        Parameters:
+        ids -- list of ids of the docs.
+        fields -- list of the fields to return, default: all the stored fields.
+        """
+        params = {'ids': ','.join(ids), 'wt': 'json'}
+        if fields:
+            params['fl'] = ','.join(fields)
+        r = open_http_session().get('{}/get'.format(self.url), params=params)
+        # The response of the real-time get handler has no `responseHeader`, which
+        # `mysolr.SolrResponse` requires.
+        if r.status_code != 200:
+            raise SolrResponseError('HTTP Status: {}\n{}'.format(r.status_code, r.content))
+        return r.json()['response']['docs']
+
     def add_file(self, doc, local_file_path):
         """
         Post a file to add to Solr server.
@@ -76,20 +221,89 @@ class Solr:
         """
         # Build url params.
         params = doc
-        params['wt'] = 'json'
-        # Normally we would use the following dictionary to attach a file to a `requests.post`:
-        #files = {'file': open(local_file_path, 'rb')}
-        # But this would fail silently when the file name contains special chars (like
-        # Chinese chars). The failure is subtle because the `requests.post` does not raise
-        # any exception, it just posts no file at all.
-        # To solve this we need to assign a fake name to the file.
-        ext = splitext(basename(local_file_path))[1]  # Get the extension of the original file.
+        params.update(self._build_update_params())
+        body = MultipartFileBody('doc', self._build_file_name(local_file_path), local_file_path)
+        self._post_extract(params, body)
+
+    def add_stream(self, doc, file_path, stream, length):
+        """
+        Post a file to add to Solr server, reading it from a stream (like the response of a
+        download) with no local file.
+
+        Parameters:
+        doc -- doc to be added.
+        file_path -- the original path of the file, only its extension is used.
+        stream -- a file-like object with the content of the file, it is closed when sent.
+        length -- the length of the content of `stream`, in bytes.
+        """
+        # Build url params.
+        params = doc
+        params.update(self._build_update_params())
+        body = MultipartStreamBody('doc', self._build_file_name(file_path), stream, length)
+        # A retry would send again a stream which has already been read.
+        self._post_extract(params, body, retries=False)
+
+    def extract_file(self, local_file_path):
+        """
+        Extract the text and the metadata of a file with the extract handler of Solr, with no
+        indexing (see `_post_extract()`).
+
+        Parameters:
+        local_file_path -- local path of the file to extract.
+        """
+        body = MultipartFileBody('doc', self._build_file_name(local_file_path), local_file_path)
+        return self._post_extract(self._build_extract_only_params(), body)
+
+    def extract_stream(self, file_path, stream, length):
+        """
+        Like `extract_file()`, but the file is read from a stream (see `add_stream()`).
+        """
+        body = MultipartStreamBody('doc', self._build_file_name(file_path), stream, length)
+        return self._post_extract(self._build_extract_only_params(), body, retries=False)
+
+    @staticmethod
+    def _build_extract_only_params():
+        return {'extractOnly': 'true', 'extractFormat': 'text', 'wt': 'json'}
+
+    @staticmethod
+    def _build_file_name(file_path):
+        """
+        Build the name of a file to post.
+        The file is posted with a fake name, because the posting of a file fails silently when
+        its name contains special chars (like Chinese chars). The failure is subtle because the
+        `requests.post` does not raise any exception, it just posts no file at all.
+        """
+        ext = splitext(basename(file_path))[1]  # Get the extension of the original file.
         # This way the posted file will be named: doc`.ext`.
-        files = {'doc': ('doc' + ext, open(local_file_path, 'rb'))}
+        return 'doc' + ext
+
+    def _post_extract(self, params, body, retries=True):
+        """
+        Post a multipart body (see `MultipartFileBody`) to the extract handler of Solr.
+        With `extractOnly` the file is not indexed: return its text and its metadata, a Python
+        dictionary like: {'Content-Type': ['application/pdf'], 'Author': ['Jane'], ...}.
+
+        Parameters:
+        params -- url params.
+        body -- a `MultipartFileBody`.
+        retries -- False if the body can be sent only once, see `utils.http.get_http_adapter()`.
+        """
+        headers = {'Content-Type': body.content_type}
 
         # Send request.
-        r = requests.post('{}/update/extract'.format(self.url), params=params, files=files)
+        r = open_http_session(retries).post('{}/update/extract'.format(self.url), params=params,
+                                            data=body, headers=headers)
         self._sanity_check(SolrResponse(r), True)
+        if params.get('extractOnly') != 'true':
+            self._last_update_at = time.monotonic()
+            return None
+
+        # The response is like: {'responseHeader': {...}, 'doc.pdf': 'the text',
+        # 'doc.pdf_metadata': ['Content-Type', ['application/pdf'], 'Author', ['Jane'], ...]}.
+        data = r.json()
+        metadata_key = next(key for key in data if key.endswith('_metadata'))
+        metadata = data[metadata_key]
+        return data[metadata_key[:-len('_metadata')]], dict(zip(metadata[::2], metadata[1::2]))
 
     def delete_by_query(self, query):
         """
@@ -99,17 +313,56 @@ class Solr:
         Parameters:
         query -- query to identify the elements to delete.
         """
-        xml_data = '<delete><query>{}</query></delete>'.format(query)
-        r = self._post_xml(xml_data)
+        self.delete_by_queries([query])
+
+    def delete_by_queries(self, queries):
+        """
+        Delete docs from Solr according to many queries, in a single request.
+
+        Parameters:
+        queries -- list of queries to identify the elements to delete.
+        """
+        xml_data = '<delete>{}</delete>'.format(
+            ''.join('<query>{}</query>'.format(escape(query)) for query in queries))
+        r = self._post_xml(xml_data, self._build_update_params())
         self._sanity_check(SolrResponse(r), True)
+        self._last_update_at = time.monotonic()
 
-    def commit(self):
+    def commit(self, durable=False):
         """
-        Send a commit to Solr.
-        It uses mysolr library.
+        Send a commit to Solr, according to settings.SOLR_COMMIT_POLICY (see `Solr`).
+
+        Parameters:
+        durable -- True if the updates must survive a crash of Solr when this method returns,
+            f.i. before removing the entries from Redis. False if they only need to be visible.
+        """
+        if settings.SOLR_COMMIT_POLICY == 'hard':
+            kind, xml = 'hard', '<commit />'
+        elif durable:
+            kind, xml = 'hard', '<commit openSearcher="false" />'
+        else:
+            kind, xml = 'soft', '<commit softCommit="true" />'
+
+        state = _get_commit_state(self.url, kind)
+        with state['lock']:
+            if state['started_at'] > self._last_update_at:
+                # A commit started after the last update of this instance: it includes it.
+                return
+            started_at = time.monotonic()
+            r = self._post_xml(xml)
+            self._sanity_check(SolrResponse(r))
+            # Recorded only once the commit succeeded: if it fails, the instances waiting for the
+            # lock send their own commit instead of relying on this one.
+            state['started_at'] = started_at
+
+    def _build_update_params(self):
+        """
+        Build the url params for a update.
         """
-        r = self._mysolr.commit()
-        self._sanity_check(r)
+        params = {'wt': 'json'}
+        if settings.SOLR_COMMIT_POLICY == 'soft':
+            params['commitWithin'] = settings.SOLR_COMMIT_WITHIN
+        return params
 
     @staticmethod
     def _sanity_check(r, is_check_solr_response=False):
@@ -128,21 +381,22 @@ class Solr:
                 raise SolrResponseError('Solr Status: {}\n{}'.format(
                     r.solr_status, r.raw_content))
 
-    def _post_xml(self, xml):
+    def _post_xml(self, xml, params=None):
         """
         Send the xml to Solr server.
         It uses requests library because mysolr library has no such a functionality.
 
         Parameters:
         xml -- XML document to be posted.
+        params -- url params, default: {'wt': 'json'}.
         """
         xml_data = xml.encode('utf-8')
         headers = {
             'Content-type': 'text/xml; charset=utf-8',
             'Content-Length': "%s" % len(xml_data)
         }
-        params = dict()
-        params['wt'] = 'json'
-        r = requests.post('{}/update'.format(self.url), params=params, data=xml_data,
-                          headers=headers)
+        if params is None:
+            params = {'wt': 'json'}
+        r = open_http_session().post('{}/update'.format(self.url), params=params, data=xml_data,
+                                     headers=headers)
         return r
\ No newline at end of file
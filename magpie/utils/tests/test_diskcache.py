@@ -0,0 +1,68 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from ..diskcache import DiskLRUCache
+
+
+class DiskLRUCacheTest(TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'cache')
+        # Random bytes, so their zlib compressed size is about the same.
+        self.value = os.urandom(1000)
+
+    def set_used_at(self, cache, key, used_at):
+        """
+        Pretend that `key` was last used at the time `used_at` (seconds from epoch).
+        """
+        os.utime(cache._build_file_path(key), (used_at, used_at))
+
+    def test_set_get(self):
+        cache = DiskLRUCache(self.path, 10000)
+        cache.set('key1', self.value)  # The command under test.
+
+        self.assertTrue(cache.has('key1'))
+        self.assertEqual(cache.get('key1'), self.value)
+        self.assertFalse(cache.has('key2'))
+        self.assertIsNone(cache.get('key2'))
+
+    def test_eviction(self):
+        """
+        When the budget is exceeded, the least recently used values are evicted.
+        """
+        cache = DiskLRUCache(self.path, 3000)
+        cache.set('key1', self.value)
+        self.set_used_at(cache, 'key1', 1000)
+        cache.set('key2', self.value)
+        self.set_used_at(cache, 'key2', 2000)
+        cache.get('key1')  # Now `key2` is the least recently used.
+
+        cache.set('key3', self.value)  # The command under test.
+
+        self.assertTrue(cache.has('key1'))
+        self.assertFalse(cache.has('key2'))
+        self.assertTrue(cache.has('key3'))
+        self.assertLessEqual(sum(os.path.getsize(entry.path) for entry in os.scandir(self.path)),
+                             3000)
+
+    def test_too_big_value(self):
+        """
+        A value bigger than the whole budget is not stored.
+        """
+        cache = DiskLRUCache(self.path, 500)
+        cache.set('key1', self.value)  # The command under test.
+
+        self.assertFalse(cache.has('key1'))
+
+    def test_disabled(self):
+        """
+        A cache with no budget stores nothing.
+        """
+        cache = DiskLRUCache(self.path, 0)
+        cache.set('key1', self.value)  # The command under test.
+
+        self.assertIsNone(cache.get('key1'))
+        self.assertFalse(os.path.exists(self.path))
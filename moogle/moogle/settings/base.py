@@ -107,3 +107,24 @@ MESSAGE_TAGS = {
 
 # Solr connection.
 SOLR_URL = 'http://192.168.1.76:8983/solr'
+
+# Search.
+# Providers are searched at the same time by a pool of this many threads (shared by all the
+# requests of the process).
+SEARCH_MAX_WORKERS = 20
+# Seconds to wait for the results of a provider, after that it is shown as timed out.
+SEARCH_TIMEOUT = 5
+# Seconds after which a network operation (connect, read) of the search of a provider (Gmail,
+# Drive and Solr) fails, so a hung provider does not hold a thread of the pool forever.
+SEARCH_PROVIDER_TIMEOUT = 15
+# Gmail IMAP connections are kept open (authenticated, with the "All Mail" folder selected) and
+# reused by the next searches of the same user, see `search.snooper.imappool`.
+# Seconds after which a idle connection is closed.
+GMAIL_IMAP_POOL_IDLE_TIMEOUT = 10*60
+# Seconds after which a idle connection is checked (with a NOOP) before being reused.
+GMAIL_IMAP_POOL_CHECK_AFTER = 60
+# Max number of idle connections per user.
+GMAIL_IMAP_POOL_MAX_IDLE = 2
+# Seconds the name of the "All Mail" folder of a Gmail account is cached (it depends on the
+# language of the account).
+GMAIL_ALL_MAIL_FOLDER_CACHE_TIMEOUT = 24*60*60
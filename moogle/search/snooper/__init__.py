@@ -1,5 +1,5 @@
 from tokens.models import Provider, BearerToken
-from utils.solr import Solr, CORE_NAMES
+from utils.solr import Solr, CORE_NAMES, build_shards
 
 
 class Snooper:
@@ -41,4 +41,71 @@ class BaseSolrSnooper:
 
         solr = Solr(CORE_NAMES[self.provider_name])
         r = solr.search(q=q, fq=fq, **self.extra_query_args)
-        return r.documents  # A list of dicts.
\ No newline at end of file
+        return r.documents  # A list of dicts.
+
+
+class MultiSolrSnooper:
+    """
+    Search many providers indexed in Solr (Twitter, Facebook, Dropbox) with a single distributed
+    request over their cores, instead of a db query and a search for each provider.
+    Results are split per bearertoken with a `group.query` each, so every provider gets its own
+    top results (like separate searches).
+    """
+    # Max number of results per provider, like the default `rows` of a search.
+    ROWS = 10
+    # Fields returned for each provider: the ones read by its `results/<provider>_results.html`
+    # template. A single `fl` is sent to all the cores, but Solr ignores the fields which are not
+    # in the schema of a core, so each core returns only its own.
+    FIELDS = {
+        Provider.NAME_TWITTER: ['id', 'text_original', 'lang', 'retweeted', 'created_at'],
+        Provider.NAME_FACEBOOK: ['id', 'message_original', 'type', 'from_name', 'from_id',
+                                 'created_time', 'updated_time'],
+        Provider.NAME_DROPBOX: ['id', 'title', 'bytes', 'mime_type', 'content_type',
+                                'remote_path', 'modified_at'],
+    }
+
+    def __init__(self, user):
+        self.user = user
+
+    def search(self, q, provider_names):
+        """
+        Return a dictionary of results (a list of dicts) by provider name.
+
+        Parameters:
+        provider_names -- a list of `Provider.NAME_*` in `CORE_NAMES`.
+        """
+        results = {provider_name: [] for provider_name in provider_names}
+        bearertokens = dict(BearerToken.objects.filter(
+            user=self.user, provider__name__in=provider_names).values_list('id', 'provider__name'))
+        if not bearertokens:
+            return results
+
+        names = sorted(set(bearertokens.values()))
+        group_queries = {'bearertoken_id:{}'.format(bearertoken_id): provider_name
+                         for bearertoken_id, provider_name in bearertokens.items()}
+        core_names = [CORE_NAMES[provider_name] for provider_name in names]
+        params = {
+            'q': q,
+            'fl': self._build_field_list(names),
+            'shards': build_shards(core_names),
+            'group.query': list(group_queries),
+            'group.limit': self.ROWS,
+        }
+        # Any core can run a distributed search.
+        docs_by_group = Solr(core_names[0]).search_grouped(**params)
+        for group_query, docs in docs_by_group.items():
+            results[group_queries[group_query]].extend(docs)
+        return results
+
+    @classmethod
+    def _build_field_list(cls, provider_names):
+        """
+        Build the `fl` param (which is the same for all the cores) from the `FIELDS` of
+        `provider_names`.
+        """
+        fields = []
+        for provider_name in provider_names:
+            for field in cls.FIELDS[provider_name]:
+                if field not in fields:
+                    fields.append(field)
+        return ','.join(fields)
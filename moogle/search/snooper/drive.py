@@ -1,4 +1,5 @@
 import urllib
+from django.conf import settings
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2.rfc6749.errors import TokenExpiredError
 
@@ -48,7 +49,7 @@ class DriveSnooper(BaseSolrSnooper):
 
         # Fetch teh protected resource
         try:
-            r = google.get(resource_url)
+            r = google.get(resource_url, timeout=settings.SEARCH_PROVIDER_TIMEOUT)
         except TokenExpiredError:
             refresh_extra_args = {'client_id': self.provider.client_id,
                                   'client_secret': self.provider.client_secret}
@@ -57,7 +58,7 @@ class DriveSnooper(BaseSolrSnooper):
                                          **refresh_extra_args)
             ##save_token(token, request.user)
             google = OAuth2Session(self.provider.client_id, token=token)
-            r = google.get(resource_url)
+            r = google.get(resource_url, timeout=settings.SEARCH_PROVIDER_TIMEOUT)
 
         # There are 2 ways to check if the current token has expired:
         # 1) Automatic refresh. The token comes with a "expires_in": 3600 field. So we can keep track of the time the token
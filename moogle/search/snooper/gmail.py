@@ -2,10 +2,15 @@ import imaplib
 import re
 import base64
 import quopri
+import socket
+
+from django.conf import settings
+from django.core.cache import cache
 
 from tokens.models import Provider, BearerToken
 from tokens.oauthlib import GmailOauthFlowManager
 from profiles.models import GmailProfile
+from .imappool import pool as imap_pool
 
 
 # Fix to avoid the "Got more than 10000 bytes" error which happens when the search gives back
@@ -14,25 +19,86 @@ from profiles.models import GmailProfile
 imaplib._MAXLINE = 50000
 
 
+class TimeoutIMAP4_SSL(imaplib.IMAP4_SSL):
+    """
+    A `imaplib.IMAP4_SSL` whose socket operations (the connect too) fail after
+    settings.SEARCH_PROVIDER_TIMEOUT seconds, so a hung Gmail does not block a search forever.
+    """
+    def _create_socket(self, *args):
+        sock = socket.create_connection((self.host, self.port), settings.SEARCH_PROVIDER_TIMEOUT)
+        return self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+
 class GmailSnooper:
     def __init__(self, user):
         self.user = user
         self.provider_name = Provider.NAME_GMAIL
         profile = GmailProfile.objects.get(user=user)
         self.email_address = profile.email
+        self.profile_id = profile.id
 
     def search(self, q):
+        """
+        Search with a pooled connection (see `ImapConnectionPool`), or with a new one if there
+        is none or if the pooled one has been dropped by Gmail in the meantime.
+        """
+        key = (self.user.id, self.email_address)
+        imap = imap_pool.get(key)
+        if imap is not None:
+            try:
+                emails = self._search(imap, q)
+            except (imaplib.IMAP4.abort, OSError):
+                # The connection was broken: try again with a new one.
+                imap_pool.discard(imap)
+            except:
+                imap_pool.discard(imap)
+                raise
+            else:
+                imap_pool.put(key, imap)
+                return emails
+
+        imap = self._open()
+        try:
+            emails = self._search(imap, q)
+        except:
+            imap_pool.discard(imap)
+            raise
+        # Keep the connection open for the next search.
+        imap_pool.put(key, imap)
+        return emails
+
+    def _open(self):
+        """
+        Open a IMAP connection to Gmail with the "All Mail" folder selected.
+        """
         imap = self._connect()
 
         # Select the right folder is important cause the search will be restricted to that folder.
         # A select with no params will default to the inbox folder.
         #   imap_conn.select()  # Default: 'INBOX'.
         # We want to select the folder containing all mails.
+        # Its name is cached, because finding it requires a LIST of all the folders (labels).
+        cache_key = 'gmail:all_mail_folder:{}'.format(self.profile_id)
+        all_mail_folder = cache.get(cache_key)
+        if all_mail_folder:
+            # Open a read-only connection cause we don;t need to send emails.
+            typ, __ = imap.select('"{}"'.format(all_mail_folder), readonly=True)
+            if typ == 'OK':
+                return imap
+            # The folder has been renamed (f.i. the user changed the language): find it again.
+            cache.delete(cache_key)
+
         all_mail_folder = FetchedEmailParser.find_all_mail_folder(imap.list())
         # Open a read-only connection cause we don;t need to send emails.
         imap.select('"{}"'.format(all_mail_folder), readonly=True)
         #imap_conn.select('"[Gmail]/Chat"', readonly=True)
+        cache.set(cache_key, all_mail_folder, settings.GMAIL_ALL_MAIL_FOLDER_CACHE_TIMEOUT)
+        return imap
 
+    def _search(self, imap, q):
+        """
+        Search with a IMAP connection with the "All Mail" folder selected.
+        """
         # Full text search like in Gmail website using the operator: X-GM-RAW.
         # Note: using the search criteria `in:all` the search will be anyway limited to the
         # selected folder.
@@ -46,39 +112,43 @@ class GmailSnooper:
         # Fetch resulting emails.
         ids = ids[-10:]  # Considering only the most recent 10 emails.
         ids.reverse()  # Reverting the order so the most recent come first.
+        if not ids:
+            return []
+        # Filtering fields to fetch only parts of the message is very useful cause it is
+        # a way to optimize the performance of the process. But the protocol used to filter
+        # the fields is very complicated.
+        # Some filtering options:
+        #  - (RFC822) -> the entire message.
+        #  - (UID BODY[TEXT]) -> the UID and the text (UID is the unique msg identifier
+        #    unique within the entire mailbox.
+        #  - ((UID X-GM-MSGID X-GM-THRID) -> the UID and the identifiers which can be used
+        #    to build a direct link to the message in gmail website.
+        #  - (BODY[HEADER]) -> only the headers (from, to, subject, date, ...).
+        #  - (ENVELOPE) -> ?.
+        #  - (BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)]) -> only subject, from, to, date.
+        #  - (BODY[TEXT]<0.100>) -> only the first 100 bytes of the text.
+        #  - (BODY.PEEK[1]<0.100> -> only the first 100 bytes of the first part (emails
+        #    are divided in parts like plain, html, attachment, ...).
+        #  - (BODY.PEEK[1.MIME]) -> only the mime of the first part.
+        # All the emails are fetched with a single command, over the message set: b'1801,1656'.
+        typ, data = imap.fetch(b','.join(ids), "(UID X-GM-MSGID X-GM-THRID BODY[HEADER.FIELDS"
+                                               " (SUBJECT FROM TO DATE)]"
+                                               " BODY.PEEK[1.MIME] BODY.PEEK[1]<0.100>)")
+        # Like method fetch but with uid.
+        #typ, data = imap_conn.uid('FETCH', b','.join(ids), "(UID X-GM-MSGID X-GM-THRID"
+        #                                       " BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)]"
+        #                                       " BODY.PEEK[1.MIME] BODY.PEEK[1]<0.100>)")
+
+        # The server sends the emails in its own order: parse them in the order of `ids`.
+        responses = FetchedEmailParser.split_response(data)
         emails = list()
         for id in ids:
-            # Filtering fields to fetch only parts of the message is very useful cause it is
-            # a way to optimize the performance of the process. But the protocol used to filter
-            # the fields is very complicated.
-            # Some filtering options:
-            #  - (RFC822) -> the entire message.
-            #  - (UID BODY[TEXT]) -> the UID and the text (UID is the unique msg identifier
-            #    unique within the entire mailbox.
-            #  - ((UID X-GM-MSGID X-GM-THRID) -> the UID and the identifiers which can be used
-            #    to build a direct link to the message in gmail website.
-            #  - (BODY[HEADER]) -> only the headers (from, to, subject, date, ...).
-            #  - (ENVELOPE) -> ?.
-            #  - (BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)]) -> only subject, from, to, date.
-            #  - (BODY[TEXT]<0.100>) -> only the first 100 bytes of the text.
-            #  - (BODY.PEEK[1]<0.100> -> only the first 100 bytes of the first part (emails
-            #    are divided in parts like plain, html, attachment, ...).
-            #  - (BODY.PEEK[1.MIME]) -> only the mime of the first part.
-            typ, data = imap.fetch(id, "(UID X-GM-MSGID X-GM-THRID BODY[HEADER.FIELDS"
-                                            " (SUBJECT FROM TO DATE)]"
-                                            " BODY.PEEK[1.MIME] BODY.PEEK[1]<0.100>)")
-            # Like method fetch but with uid.
-            #typ, data = imap_conn.uid('FETCH', id, "(UID X-GM-MSGID X-GM-THRID"
-            #                                       " BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)]"
-            #                                       " BODY.PEEK[1.MIME] BODY.PEEK[1]<0.100>)")
-
+            if id not in responses:
+                continue  # Expunged in the meantime.
             # Parse and add the fetched email.
-            parser = FetchedEmailParser(data, self.email_address)
+            parser = FetchedEmailParser(responses[id], self.email_address)
             emails.append(parser.parse())
 
-        # Close connection.
-        self._disconnect(imap)
-
         return emails
 
     def _build_auth_string(self):
@@ -95,7 +165,7 @@ class GmailSnooper:
         Open a IMAP connection to Gmail.
         """
         def do_connect():
-            connection = imaplib.IMAP4_SSL('imap.gmail.com')
+            connection = TimeoutIMAP4_SSL('imap.gmail.com')
             #connection.debug = 4  # Prints all the steps to stdout.
             auth_string = self._build_auth_string()
             connection.authenticate('XOAUTH2', lambda x: auth_string)
@@ -114,13 +184,6 @@ class GmailSnooper:
                 raise
         return connection
 
-    def _disconnect(self, connection):
-        """
-        CLose a IMAP connection to Gmail.
-        """
-        connection.close()
-        connection.logout()
-
 
 class FetchedEmailParser:
     """
@@ -361,6 +424,29 @@ class FetchedEmailParser:
         return field
 
 
+    @staticmethod
+    def split_response(response):
+        """
+        Split the response to a FETCH command over many messages in the responses of the single
+        messages (see `parse()`).
+        Return a dictionary of responses by message number (a byte string like: b'24294').
+
+        Parameters:
+        response -- a list like the one in `parse()`, but with the parts of all the messages one
+            after the other. The key of the 1st part of a message starts with its number, like:
+            b'24294 (X-GM-THRID 1447735411271508216 ...'.
+        """
+        responses = dict()
+        current = None
+        for el in response:
+            if isinstance(el, tuple):
+                match = re.match(rb'\s*(\d+) \(', el[0])
+                if match:  # The 1st part of a new message.
+                    current = responses[match.group(1)] = []
+            if current is not None:
+                current.append(el)
+        return responses
+
     @staticmethod
     def find_all_mail_folder(response):
         """
@@ -0,0 +1,95 @@
+import imaplib
+import threading
+import time
+
+from django.conf import settings
+
+
+class ImapConnectionPool:
+    """
+    A pool of IMAP connections, already authenticated and with a folder already selected, by key
+    (like a user id), so a search skips the TLS handshake, the authentication, the LIST and the
+    SELECT of a new connection.
+
+    Connections idle for more than settings.GMAIL_IMAP_POOL_IDLE_TIMEOUT seconds are logged out,
+    and connections idle for more than settings.GMAIL_IMAP_POOL_CHECK_AFTER seconds are checked
+    with a NOOP before being reused. At most settings.GMAIL_IMAP_POOL_MAX_IDLE connections are
+    kept per key.
+    It is thread-safe, but a connection is used by one thread at a time: it is out of the pool
+    from `get()` to `put()` (or `discard()`).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Idle connections: lists of (connection, time when it was released), by key.
+        self._idle = dict()
+
+    def get(self, key):
+        """
+        Return a healthy idle connection for `key`, or None.
+        """
+        while True:
+            with self._lock:
+                expired = self._pop_expired()
+                try:
+                    connection, released_at = self._idle.get(key, []).pop()
+                except IndexError:
+                    connection = None
+            for expired_connection in expired:
+                self.discard(expired_connection)
+
+            if connection is None:
+                return None
+            if time.monotonic() - released_at < settings.GMAIL_IMAP_POOL_CHECK_AFTER or \
+               self._is_healthy(connection):
+                return connection
+            self.discard(connection)
+
+    def put(self, key, connection):
+        """
+        Give back a connection got with `get()` (or a new one) to the pool.
+        """
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < settings.GMAIL_IMAP_POOL_MAX_IDLE:
+                connections.append((connection, time.monotonic()))
+                connection = None
+        if connection is not None:
+            self.discard(connection)
+
+    @staticmethod
+    def discard(connection):
+        """
+        Log out a connection which is not going to be given back to the pool.
+        """
+        try:
+            connection.logout()
+        except Exception:  # It could be broken already.
+            pass
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            typ, __ = connection.noop()
+        except (imaplib.IMAP4.error, OSError):
+            return False
+        return typ == 'OK'
+
+    def _pop_expired(self):
+        """
+        Remove from the pool the connections idle for too long and return them. It must be
+        called with the lock held.
+        """
+        now = time.monotonic()
+        expired = []
+        for key, connections in list(self._idle.items()):
+            expired.extend(connection for connection, released_at in connections
+                           if now - released_at > settings.GMAIL_IMAP_POOL_IDLE_TIMEOUT)
+            connections[:] = [(connection, released_at) for connection, released_at in connections
+                              if now - released_at <= settings.GMAIL_IMAP_POOL_IDLE_TIMEOUT]
+            if not connections:
+                del self._idle[key]
+        return expired
+
+
+# Process-wide pool of Gmail IMAP connections, by user.
+pool = ImapConnectionPool()
@@ -1,3 +1,101 @@
+import json
+from unittest.mock import Mock, patch
+
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from tokens.models import Provider
+from utils.solr import parse_grouped_response
+from .snooper import MultiSolrSnooper
+from .snooper.gmail import FetchedEmailParser
+
+
+# A response of Solr to a distributed search over the twitter and dropbox cores, with a
+# `group.query` for each bearertoken.
+GROUPED_RESPONSE = b"""{
+  "responseHeader": {"status": 0, "QTime": 12, "params": {"q": "moogle", "group": "true",
+    "group.query": ["bearertoken_id:1", "bearertoken_id:3"], "group.limit": "10",
+    "fl": "id,text_original,lang,retweeted,created_at,title,bytes,mime_type,content_type,\
+remote_path,modified_at", "wt": "json",
+    "shards": "127.0.0.1:8983/solr/dropbox,127.0.0.1:8983/solr/twitter"}},
+  "grouped": {
+    "bearertoken_id:1": {"matches": 3, "doclist": {"numFound": 1, "start": 0, "docs": [
+      {"id": "1_461162458442506241", "text_original": "Moogle is out!", "lang": "en",
+       "retweeted": false, "created_at": "2014-04-29T15:32:30Z"}]}},
+    "bearertoken_id:3": {"matches": 3, "doclist": {"numFound": 2, "start": 0, "docs": [
+      {"id": "3:a1b2c3", "title": ["Moogle"], "bytes": 205, "mime_type": "text/plain",
+       "remote_path": "/temp/moogletest/uno.txt", "modified_at": "2014-01-27T21:09:36Z"},
+      {"id": "3:d4e5f6", "bytes": 1024, "mime_type": "application/pdf",
+       "content_type": ["application/pdf"], "remote_path": "/temp/moogletest/due.pdf",
+       "modified_at": "2014-01-28T10:00:00Z"}]}}
+  }
+}"""
+
+
+class MultiSolrSnooperTest(TestCase):
+
+    def test_parse_grouped_response(self):
+        docs_by_group = parse_grouped_response(json.loads(GROUPED_RESPONSE.decode('utf-8')))
+
+        self.assertEqual(sorted(docs_by_group), ['bearertoken_id:1', 'bearertoken_id:3'])
+        self.assertEqual([doc['id'] for doc in docs_by_group['bearertoken_id:3']],
+                         ['3:a1b2c3', '3:d4e5f6'])
+
+    @patch('search.snooper.BearerToken')
+    @patch('utils.solr._session')
+    def test_search(self, session, BearerToken):
+        """
+        The results of a single grouped search are split by provider.
+        """
+        BearerToken.objects.filter.return_value.values_list.return_value = [
+            (1, Provider.NAME_TWITTER), (3, Provider.NAME_DROPBOX)]
+        post = session.post
+        post.return_value = Mock(status_code=200, content=GROUPED_RESPONSE, headers={},
+                                 url='http://127.0.0.1:8983/solr/dropbox/select')
+        post.return_value.json.return_value = json.loads(GROUPED_RESPONSE.decode('utf-8'))
+        results = MultiSolrSnooper(Mock()).search('moogle', [  # The command under test.
+            Provider.NAME_TWITTER, Provider.NAME_FACEBOOK, Provider.NAME_DROPBOX])
+
+        self.assertEqual([tweet['text_original'] for tweet in results[Provider.NAME_TWITTER]],
+                         ['Moogle is out!'])
+        self.assertEqual(results[Provider.NAME_FACEBOOK], [])
+        self.assertEqual([doc['remote_path'] for doc in results[Provider.NAME_DROPBOX]],
+                         ['/temp/moogletest/uno.txt', '/temp/moogletest/due.pdf'])
+        params = post.call_args[1]['data']
+        self.assertEqual(params['group'], 'true')
+        self.assertEqual(post.call_args[1]['timeout'], settings.SEARCH_PROVIDER_TIMEOUT)
+        self.assertEqual(sorted(params['group.query']), ['bearertoken_id:1', 'bearertoken_id:3'])
+        # Every field read by the templates of the providers searched.
+        self.assertEqual(params['fl'].split(','), MultiSolrSnooper.FIELDS[Provider.NAME_DROPBOX] +
+                         MultiSolrSnooper.FIELDS[Provider.NAME_TWITTER][1:])
+
+
+class FetchedEmailParserTest(TestCase):
+
+    def test_split_response(self):
+        """
+        The response to a FETCH over many messages is split by message number, whatever the
+        order of the messages.
+        """
+        response = [
+            (b'1801 (X-GM-THRID 1447735411271508216 X-GM-MSGID 1447735411271508216 UID 110780'
+             b' BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)] {20}',
+             b'Subject: Second\r\n\r\n'),
+            (b' BODY[1]<0> {5}', b'text2'),
+            (b' BODY[1.MIME] {30}', b'Content-Type: text/plain\r\n\r\n'),
+            b')',
+            (b'1656 (X-GM-THRID 1447735411271508217 X-GM-MSGID 1447735411271508217 UID 110781'
+             b' BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)] {19}',
+             b'Subject: First\r\n\r\n'),
+            (b' BODY[1]<0> {5}', b'text1'),
+            (b' BODY[1.MIME] {30}', b'Content-Type: text/plain\r\n\r\n'),
+            b')',
+        ]
+        responses = FetchedEmailParser.split_response(response)  # The command under test.
+
+        self.assertEqual(sorted(responses), [b'1656', b'1801'])
+        self.assertEqual(responses[b'1801'], response[:4])
+        self.assertEqual(responses[b'1656'], response[4:])
+
+    def test_split_empty_response(self):
+        self.assertEqual(FetchedEmailParser.split_response([]), {})
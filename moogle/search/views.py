@@ -1,8 +1,11 @@
 # Stdlib imports
-# E.g.: from math import sqrt
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
 
 # Core Django imports
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import connection
 from django.shortcuts import redirect, render
 
 # Third-party app imports
@@ -10,7 +13,14 @@ from django.shortcuts import redirect, render
 
 # Imports from local apps
 from tokens.models import BearerToken, Provider
-from .snooper import Snooper
+from utils.solr import CORE_NAMES
+from .snooper import Snooper, MultiSolrSnooper
+
+
+log = logging.getLogger(__name__)
+
+# Process-wide pool of threads which run the searches of all the requests.
+executor = ThreadPoolExecutor(max_workers=settings.SEARCH_MAX_WORKERS)
 
 
 def home(request, template='home.html'):
@@ -30,13 +40,67 @@ def home(request, template='home.html'):
 
 @login_required
 def search(request, template='search.html'):
+    """
+    Search all the selected providers at the same time, so the page takes as long as the slowest
+    provider, not as the sum of all of them.
+    A provider which does not answer within settings.SEARCH_TIMEOUT seconds is shown as timed
+    out, and one whose search raised an exception is shown as failed.
+    The providers indexed in Solr are searched with a single request (see `MultiSolrSnooper`).
+    """
     q = request.GET.get('q', '')
     args = dict()
+    # Futures of the searches, by the list of the providers they search. Each future returns a
+    # dictionary of results by provider name.
+    futures = dict()
+    solr_provider_names = []
     for provider_name, __ in Provider.NAME_CHOICES:
         is_selected = True if request.GET.get(provider_name, '').lower() == 'true' else False
         args['{}_is_selected'.format(provider_name)] = is_selected
+        args['{}_results'.format(provider_name)] = []
+        args['{}_is_timed_out'.format(provider_name)] = False
+        args['{}_is_failed'.format(provider_name)] = False
+        if is_selected and provider_name in CORE_NAMES:
+            solr_provider_names.append(provider_name)
+        elif is_selected:
+            futures[(provider_name,)] = executor.submit(_search, [provider_name], request.user,
+                                                        q)
+    if solr_provider_names:
+        futures[tuple(solr_provider_names)] = executor.submit(_search, solr_provider_names,
+                                                              request.user, q)
+
+    wait(futures.values(), timeout=settings.SEARCH_TIMEOUT)
+    for provider_names, future in futures.items():
+        if future.done():
+            try:
+                results_by_provider = future.result()
+            except Exception:
+                # Only the providers of this search fail, not the whole page.
+                log.exception('Search failed for: {}.'.format(', '.join(provider_names)))
+                for provider_name in provider_names:
+                    args['{}_is_failed'.format(provider_name)] = True
+                continue
+            for provider_name, results in results_by_provider.items():
+                args['{}_results'.format(provider_name)] = results
+        else:
+            # Too slow: its results are dropped. A search which has not started yet is cancelled,
+            # a running one is bounded by the network timeouts (settings.SEARCH_PROVIDER_TIMEOUT).
+            future.cancel()
+            for provider_name in provider_names:
+                args['{}_is_timed_out'.format(provider_name)] = True
+
+    return render(request, template, args)
 
-        results = Snooper(provider_name, request.user).search(q) if is_selected else []
-        args['{}_results'.format(provider_name)] = results
 
-    return render(request, template, args)
\ No newline at end of file
+def _search(provider_names, user, q):
+    """
+    Search the providers `provider_names` (many only if they are all indexed in Solr).
+    Return a dictionary of results by provider name. It runs in the pool of threads.
+    """
+    try:
+        if len(provider_names) > 1:
+            return MultiSolrSnooper(user).search(q, provider_names)
+        return {provider_names[0]: Snooper(provider_names[0], user).search(q)}
+    finally:
+        # Django opens a db connection per thread and the threads of the pool live forever:
+        # the connection must be closed here, like Django does at the end of a request.
+        connection.close()
\ No newline at end of file
@@ -1,4 +1,6 @@
+import requests
 from mysolr import Solr as MySolr
+from mysolr.response import SolrResponse
 
 from django.conf import settings
 
@@ -6,6 +8,9 @@ from .exceptions import SolrResponseError
 from tokens.models import Provider
 
 
+# Process-wide HTTP session, so searches reuse the keep-alive connections to Solr.
+_session = requests.Session()
+
 CORE_NAMES = {
     Provider.NAME_TWITTER: 'twitter',
     Provider.NAME_FACEBOOK: 'facebook',
@@ -13,6 +18,29 @@ CORE_NAMES = {
 }
 
 
+def build_shards(core_names):
+    """
+    Build the `shards` param of a distributed search over many cores, like:
+    '192.168.1.76:8983/solr/twitter,192.168.1.76:8983/solr/facebook'.
+    """
+    address = settings.SOLR_URL.split('://', 1)[-1].rstrip('/')
+    return ','.join('{}/{}'.format(address, core_name) for core_name in core_names)
+
+
+def parse_grouped_response(content):
+    """
+    Parse the response of a search with result grouping by `group.query`, which mysolr does not
+    parse, like:
+    {'grouped': {'bearertoken_id:1': {'matches': 5, 'doclist': {'docs': [...], ...}}, ...}, ...}
+    Return a dictionary of docs (a list of dicts) by group query.
+
+    Parameters:
+    content -- the response, a Python dictionary.
+    """
+    return {group_query: group['doclist']['docs']
+            for group_query, group in content['grouped'].items()}
+
+
 def escape_solr_query(query):
     """
     Escape special chars for Solr queries.
@@ -45,15 +73,34 @@ class Solr:
             self._mysolr_cache = MySolr(self.url)
             return self._mysolr_cache
 
-    def search(self, *args, **kwargs):
+    def search(self, **kwargs):
         """
-        Search in Solr.
-        It uses mysolr library.
+        Search in Solr, like `mysolr.Solr.search`.
+        It uses requests library because mysolr sets no timeout, see `_post_select()`.
+        Return a `mysolr.SolrResponse`.
         """
-        r = self._mysolr.search(*args, **kwargs)
+        r = SolrResponse(self._post_select(kwargs))
         self._sanity_check(r, True)
         return r
 
+    def search_grouped(self, **kwargs):
+        """
+        Search in Solr with result grouping by `group.query`, see `parse_grouped_response()`.
+        It does not use mysolr library because it does not parse grouped responses.
+        """
+        r = self._post_select(dict(kwargs, group='true'))
+        self._sanity_check(SolrResponse(r), True)
+        return parse_grouped_response(r.json())
+
+    def _post_select(self, params):
+        """
+        Post a search to Solr, with a timeout of settings.SEARCH_PROVIDER_TIMEOUT seconds so a
+        hung Solr does not hold a thread of the pool of the searches forever.
+        Return a `requests.models.Response`.
+        """
+        return _session.post('{}/select'.format(self.url), data=dict(params, wt='json'),
+                             timeout=settings.SEARCH_PROVIDER_TIMEOUT)
+
     def commit(self):
         """
         Send a commit to Solr.